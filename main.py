@@ -1,21 +1,100 @@
-import customtkinter as ctk
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+import time
 import threading
+import importlib
+import contextlib
+
+class StartupReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = {}
+        self.lazy_imports = {}
+        self.phases = []
+
+    @contextlib.contextmanager
+    def importing(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.imports[name] = time.perf_counter() - started
+
+    def mark(self, phase):
+        self.phases.append((phase, time.perf_counter() - self.started))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(self.imports.items(), key=lambda kv: -kv[1]))
+        phases = " · ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases)
+        return f"Khởi động: {phases} (thư viện: {imports})"
+
+    def lazy_summary(self):
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(self.lazy_imports.items(), key=lambda kv: -kv[1]))
+
+startup = StartupReport()
+
+class LazyModule:
+    def __init__(self, name, alias=None, on_load=None):
+        self._name = name
+        self._alias = alias or name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    if self._on_load:
+                        self._on_load(module)
+                    startup.lazy_imports[self._name] = time.perf_counter() - started
+                    globals()[self._alias] = module
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+with startup.importing('tkinter'):
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+with startup.importing('PIL'):
+    from PIL import Image, ImageTk, ImageDraw
+with startup.importing('customtkinter'):
+    import customtkinter as ctk
+with startup.importing('keyboard'):
+    import keyboard
 import os
 import webbrowser
 import logging
+import logging.handlers
+import queue
+import gzip
+import shutil
+import atexit
 import configparser
-import pyautogui
-import time
-import pandas as pd
-from PIL import Image, ImageTk, ImageDraw
-import keyboard
+import sys
+import argparse
 import colorsys
 import json
 import copy
-import cv2
 import random
+import functools
+import hashlib
+import linecache
+import inspect
+from collections import namedtuple, OrderedDict, deque
+from types import MappingProxyType
+from array import array
+
+cv2 = LazyModule('cv2')
+np = LazyModule('numpy', alias='np')
+pyautogui = LazyModule('pyautogui', on_load=lambda module: setattr(module, 'FAILSAFE', True))
+lazy_modules = {'cv2': cv2, 'numpy': np, 'pyautogui': pyautogui}
+startup.mark("Thư viện")
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("dark-blue")
@@ -29,32 +108,160 @@ DARK_BG = "#1e1e1e"
 FRAME_BG = "#2b2b2b"
 BUTTON_BG = "#3a3a3a"
 MAIN_FONT = "ZFVCutiegirl"
+UI_STATE_KEYS = {'adl_loaded': 'list', 'connected': 'connected', 'discovery_open': 'device_discovery'}
+UI_STATE_FACTS = {key: fact for fact, key in UI_STATE_KEYS.items()}
+BATCH_CATEGORIES = {"Ghi địa chỉ": "address", "Ghi địa chỉ & Test": "address_test"}
+WINDOW_TOOLS = ('device_manager', 'device_configuration')
+
+Box = namedtuple('Box', 'left top width height')
+Match = namedtuple('Match', 'left top width height score variant')
+Point = namedtuple('Point', 'x y')
+Job = namedtuple('Job', 'name run kind', defaults=(None,))
+SAMPLED = {'sampled': True}
+RAINBOW_PALETTE = ['#%02x%02x%02x' % tuple(int(255 * v) for v in colorsys.hsv_to_rgb(i / 100, 1, 1)) for i in range(100)]
+
+def gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, filename, max_bytes, backup_count, rotate_daily=False):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rotate_daily = rotate_daily
+        self.namer = lambda name: name + '.gz'
+        self.rotator = gzip_rotator
+        mtime = os.path.getmtime(filename) if os.path.exists(filename) else time.time()
+        self.opened_on = time.strftime('%Y-%m-%d', time.localtime(mtime))
+
+    def shouldRollover(self, record):
+        if self.rotate_daily and time.strftime('%Y-%m-%d', time.localtime(record.created)) != self.opened_on:
+            return True
+        return super().shouldRollover(record)
 
-def setup_logging():
-    log_file_path = os.path.join(os.path.dirname(__file__), 'log.txt')
+    def doRollover(self):
+        super().doRollover()
+        self.opened_on = time.strftime('%Y-%m-%d')
 
-    if not os.path.exists(log_file_path):
-        open(log_file_path, 'a', encoding='utf-8').close()
+class SamplingFilter(logging.Filter):
+    def __init__(self, interval, max_level=logging.INFO):
+        super().__init__()
+        self.interval = interval
+        self.max_level = max_level
+        self._last = {}
+        self._dropped = {}
+        self.reported = {}
+
+    def filter(self, record):
+        if self.interval <= 0 or record.levelno > self.max_level or not getattr(record, 'sampled', False):
+            return True
+        key = (record.pathname, record.lineno)
+        last = self._last.get(key)
+        if last is not None and record.created - last < self.interval:
+            self._dropped[key] = self._dropped.get(key, 0) + 1
+            return False
+        self._last[key] = record.created
+        dropped = self._dropped.pop(key, 0)
+        if dropped:
+            self.reported[key] = dropped
+        return True
+
+class SamplingFormatter(logging.Formatter):
+    def __init__(self, fmt, sampler):
+        super().__init__(fmt)
+        self.sampler = sampler
+
+    def format(self, record):
+        text = super().format(record)
+        if not getattr(record, 'sampled', False):
+            return text
+        dropped = self.sampler.reported.pop((record.pathname, record.lineno), 0)
+        return f"{text} (+{dropped} dòng tương tự)" if dropped else text
+
+class LogPipeline:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = logging.handlers.QueueHandler(self.queue)
+        self.queue_handler.setFormatter(logging.Formatter('%(message)s'))
+        self.listener = None
+
+    def start(self, level='INFO', max_bytes=5 * 1024 * 1024, backup_count=10, rotate_daily=True, sample_interval=1.0):
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        sampler = SamplingFilter(sample_interval)
+        file_handler = CompressingRotatingFileHandler(self.filepath, max_bytes, backup_count, rotate_daily)
+        file_handler.addFilter(sampler)
+        file_handler.setFormatter(SamplingFormatter(log_format, sampler))
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(log_format))
+        log_level = logging.getLevelName(str(level).upper())
+        logging.getLogger().setLevel(log_level if isinstance(log_level, int) else logging.INFO)
+        self.listener = logging.handlers.QueueListener(self.queue, file_handler, stream_handler)
+        self.listener.start()
+        atexit.register(self.stop)
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file_path, mode='a', encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+    def stop(self):
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+log_pipeline = LogPipeline(os.path.join(os.path.dirname(__file__), 'log.txt'))
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, handlers=[log_pipeline.queue_handler])
     logger = logging.getLogger(__name__)
     logger.info("------------- ACS Auto -------------")
     return logger
 
 logger = setup_logging()
 
+GENERAL_SETTINGS = {
+    'icon_folder': (str, 'icons'),
+    'image_folder': (str, 'images'),
+    'screenshot_delay_sec': (float, 0.5),
+    'action_delay_sec': (float, 0.2),
+    'find_image_confidence': (float, 0.9),
+    'hotspot_padding_px': (int, 40),
+    'variant_stale_runs': (int, 20),
+    'pyramid_scale': (int, 1),
+    'pyramid_coarse_confidence': (float, 0.6),
+    'pyramid_candidates': (int, 3),
+    'capture_fps': (float, 15),
+    'record_sessions': (bool, False),
+    'backend': (str, 'pyautogui'),
+    'simulator_scenario': (str, 'simulator.json'),
+    'startup_budget_sec': (float, 3),
+    'video_cache_mb': (int, 128),
+    'log_level': (str, 'INFO'),
+    'log_max_mb': (float, 5),
+    'log_backup_count': (int, 10),
+    'log_rotate_daily': (bool, True),
+    'log_sample_interval_sec': (float, 1.0),
+    'device_manager_title': (str, 'ACS Device Manager - Version 1.5.0'),
+    'device_manager_exe': (str, r'D:\Program Files\ACS\ACS Device Manager_1.5.0\Acs_Device_Manager_v1.5.0.exe'),
+    'device_configuration_title': (str, 'ACS Device Configuration - Version 1.6.0'),
+    'device_configuration_exe': (str, r'D:\Program Files\ACS\ACS Device Configuration 1.6.0\ACS_Device_Configuration.exe'),
+    'prelaunch_tools': (bool, True),
+    'max_pending_jobs': (int, 5),
+}
+
+Settings = namedtuple('Settings', list(GENERAL_SETTINGS) + ['image_paths'])
+
+def format_setting(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value)
+
 class ConfigManager:
-    def __init__(self, config_file='config.ini'):
+    def __init__(self, config_file='config.ini', save_delay=0.5):
         self.config_file = os.path.join(os.path.dirname(__file__), config_file)
         self.config = configparser.ConfigParser()
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._save_timer = None
         self._load_config()
+        self.settings = self._build_settings()
+        atexit.register(self.flush_pending)
 
     def _load_config(self):
         if not os.path.exists(self.config_file):
@@ -67,18 +274,33 @@ class ConfigManager:
             self._create_default_config()
 
     def _create_default_config(self):
-        self.config['GENERAL'] = {
-            'icon_folder': 'icons',
-            'image_folder': 'images',
-            'screenshot_delay_sec': '0.5',
-            'action_delay_sec': '0.2',
-            'find_image_confidence': '0.9'
-        }
+        self.config['GENERAL'] = {key: format_setting(default) for key, (_, default) in GENERAL_SETTINGS.items()}
         self.config['IMAGE_PATHS'] = {
             'connected': 'connected.png',
 
         }
-        self.save_config()
+        self.flush()
+
+    def _parse_setting(self, key, raw):
+        value_type, default = GENERAL_SETTINGS[key]
+        if raw is None:
+            return default
+        try:
+            if value_type is bool:
+                return raw.strip().lower() in ('1', 'true', 'yes', 'on')
+            return value_type(raw)
+        except ValueError:
+            logger.warning(f"Giá trị config '{key} = {raw}' không hợp lệ. Sử dụng mặc định: {default}")
+            return default
+
+    def _build_settings(self):
+        with self._lock:
+            general = {key: self._parse_setting(key, self.config.get('GENERAL', key, fallback=None)) for key in GENERAL_SETTINGS}
+            image_paths = {}
+            if self.config.has_section('IMAGE_PATHS'):
+                for key, value in self.config.items('IMAGE_PATHS'):
+                    image_paths[key] = tuple(f.strip() for f in value.split(',') if f.strip())
+        return Settings(image_paths=MappingProxyType(image_paths), **general)
 
     def get(self, section, option, default=None):
         try:
@@ -88,40 +310,68 @@ class ConfigManager:
             return default
 
     def set(self, section, option, value):
-        if not self.config.has_section(section):
-            self.config.add_section(section)
-        self.config.set(section, option, str(value))
+        self.update(section, {option: value})
+
+    def update(self, section, values):
+        with self._lock:
+            if not self.config.has_section(section):
+                self.config.add_section(section)
+            for option, value in values.items():
+                self.config.set(section, option, str(value))
+        self.save_config()
+
+    def remove_option(self, section, option):
+        with self._lock:
+            self.config.remove_option(section, option)
         self.save_config()
 
     def save_config(self):
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as configfile:
-                self.config.write(configfile)
-            logger.info(f"config đã lưu vào {self.config_file}")
-        except IOError as e:
-            logger.error(f"Lỗi lưu file config {self.config_file}: {e}")
+        self.settings = self._build_settings()
+        with self._lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush_pending(self):
+        if self._save_timer:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+                self._save_timer = None
+            temp_file = self.config_file + '.tmp'
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as configfile:
+                    self.config.write(configfile)
+                os.replace(temp_file, self.config_file)
+                logger.info(f"config đã lưu vào {self.config_file}")
+            except OSError as e:
+                logger.error(f"Lỗi lưu file config {self.config_file}: {e}")
 
 config_manager = ConfigManager()
-
-
-pyautogui.FAILSAFE = True
+log_pipeline.start(
+    level=config_manager.settings.log_level,
+    max_bytes=int(config_manager.settings.log_max_mb * 1024 * 1024),
+    backup_count=config_manager.settings.log_backup_count,
+    rotate_daily=config_manager.settings.log_rotate_daily,
+    sample_interval=config_manager.settings.log_sample_interval_sec)
 
 class IconManager:
+    ICONS = ['add', 'edit', 'delete', 'save', 'photo', 'up', 'down', 'file', 'excel', 'code', 'check', 'x']
+
     def __init__(self):
-        self.image_folder = os.path.join(os.path.dirname(__file__), config_manager.get('GENERAL', 'icon_folder'))
-
-        self.add = self.load_icon("add.png", size=(20, 20))
-        self.edit = self.load_icon("edit.png", size=(20, 20))
-        self.delete = self.load_icon("delete.png", size=(20, 20))
-        self.save = self.load_icon("save.png", size=(20, 20))
-        self.photo = self.load_icon("photo.png", size=(20, 20))
-        self.up = self.load_icon("up.png", size=(20, 20))
-        self.down = self.load_icon("down.png", size=(20, 20))
-        self.file = self.load_icon("file.png", size=(20, 20))
-        self.excel = self.load_icon("excel.png", size=(20, 20))
-        self.code = self.load_icon("code.png", size=(20, 20))
-        self.check = self.load_icon("check.png", size=(20, 20))
-        self.x = self.load_icon("x.png", size=(20, 20))
+        self.image_folder = os.path.join(os.path.dirname(__file__), config_manager.settings.icon_folder)
+
+    def __getattr__(self, name):
+        if name not in self.ICONS:
+            raise AttributeError(name)
+        icon = self.load_icon(f"{name}.png", size=(20, 20))
+        setattr(self, name, icon)
+        return icon
 
     def load_icon(self, filename, size=(20, 20)):
         try:
@@ -136,29 +386,117 @@ class IconManager:
             return None
 
 icons = IconManager()
+startup.mark("Cấu hình")
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3):
+    boxes = np.asarray(boxes)
+    scores = np.asarray(scores)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.intp)
+
+def score_map_peaks(scores, threshold, neighborhood, max_peaks=None):
+    n_w, n_h = max(int(neighborhood[0]), 1), max(int(neighborhood[1]), 1)
+    local_max = cv2.dilate(scores, np.ones((n_h, n_w), np.uint8))
+    ys, xs = np.nonzero((scores >= threshold) & (scores >= local_max))
+    peak_scores = scores[ys, xs]
+    order = np.argsort(-peak_scores, kind='stable')
+    if max_peaks is not None:
+        order = order[:max_peaks]
+    return xs[order], ys[order], peak_scores[order]
+
+class Template:
+    def __init__(self, path, image, mtime):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.image = np.ascontiguousarray(image)
+        self.height, self.width = image.shape[:2]
+        self.mtime = mtime
+        self.checked_at = time.time()
+        self._scaled = {}
+
+    def scaled(self, factor, min_size=8):
+        if factor not in self._scaled:
+            width, height = self.width // factor, self.height // factor
+            if width < min_size or height < min_size:
+                self._scaled[factor] = None
+            else:
+                self._scaled[factor] = cv2.resize(self.image, (width, height), interpolation=cv2.INTER_AREA)
+        return self._scaled[factor]
 
-class ACSAutomation:
-    def __init__(self):
-        self.icon_folder = os.path.join(os.path.dirname(__file__), config_manager.get('GENERAL', 'icon_folder'))
-        self.image_folder = os.path.join(os.path.dirname(__file__), config_manager.get('GENERAL', 'image_folder'))
-        self.screenshot_delay = float(config_manager.get('GENERAL', 'screenshot_delay_sec'))
-        self.action_delay = float(config_manager.get('GENERAL', 'action_delay_sec'))
-        self.confidence = float(config_manager.get('GENERAL', 'find_image_confidence'))
-
-        self.excel_data = None
-        self.current_excel_row_index = 0
+class TemplateCache:
+    def __init__(self, image_folder, revalidate_interval=1.0):
+        self.image_folder = image_folder
+        self.revalidate_interval = revalidate_interval
+        self._templates = {}
+        self._keys = {}
+        self._lock = threading.RLock()
 
-        self.stop_requested = False
-        self.enable_auto_increment = True
+    def _decode(self, path):
+        try:
+            mtime = os.path.getmtime(path)
+            data = np.fromfile(path, dtype=np.uint8)
+            image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        except OSError as e:
+            logger.warning(f"Không thể đọc hình ảnh {path}: {e}")
+            return None
+        if image is None:
+            logger.warning(f"Không thể giải mã hình ảnh: {path}")
+            return None
+        return Template(path, image, mtime)
 
-    def _get_image_paths_list(self, image_name_key):
-        filenames_str = config_manager.get('IMAGE_PATHS', image_name_key)
-        if not filenames_str:
+    def _get_template(self, path):
+        now = time.time()
+        template = self._templates.get(path)
+        if template and now - template.checked_at < self.revalidate_interval:
+            return template
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self._templates.pop(path, None)
+            return None
+        if template and template.mtime == mtime:
+            template.checked_at = now
+            return template
+        if template:
+            logger.info(f"Hình ảnh '{template.name}' đã thay đổi, đang tải lại.")
+        template = self._decode(path)
+        if template:
+            self._templates[path] = template
+        else:
+            self._templates.pop(path, None)
+        return template
+
+    def get_paths(self, image_paths):
+        with self._lock:
+            templates = [self._get_template(path) for path in image_paths]
+        return [t for t in templates if t is not None]
+
+    def get(self, image_name_key):
+        filenames = config_manager.settings.image_paths.get(image_name_key)
+        with self._lock:
+            cached = self._keys.get(image_name_key)
+            if cached and cached[0] == filenames:
+                return self.get_paths(cached[1])
+
+        if not filenames:
             logger.error(f"Đường dẫn hình ảnh '{image_name_key}' không tìm thấy trong config.ini")
             return []
-        
-        filenames = [f.strip() for f in filenames_str.split(',') if f.strip()]
-        
+
         full_paths = []
         for filename in filenames:
             full_path = os.path.join(self.image_folder, filename)
@@ -166,45 +504,1297 @@ class ACSAutomation:
                 logger.warning(f"Không tìm thấy file hình ảnh: {full_path} cho '{image_name_key}'. Bỏ qua đường dẫn này.")
             else:
                 full_paths.append(full_path)
-        
         if not full_paths:
             logger.warning(f"Không tìm thấy file hình ảnh cho '{image_name_key}'.")
-        return full_paths
 
-    def find_and_click(self, image_name_key, timeout=30, button='left', double_click=False, confidence_override=None):
-        image_paths = self._get_image_paths_list(image_name_key)
-        if not image_paths:
-            return False
+        with self._lock:
+            self._keys[image_name_key] = (filenames, full_paths)
+        return self.get_paths(full_paths)
 
-        current_confidence = confidence_override if confidence_override is not None else self.confidence
-        logger.info(f"Đang tìm kiếm bất kỳ hình ảnh nào trong {image_name_key} (thời gian chờ={timeout}s, độ tin cậy={current_confidence})")
+    def get_image_paths(self, image_name_key):
+        return [t.path for t in self.get(image_name_key)]
+
+    def preload(self):
+        keys = list(config_manager.settings.image_paths)
+        if not keys:
+            return
         start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self.stop_requested:
-                return "Đã dừng."
-            for image_path in image_paths:
+        for key in keys:
+            self.get(key)
+        logger.info(f"Đã tải trước {len(self._templates)} hình ảnh cho {len(keys)} key trong {time.time() - start_time:.2f}s")
+
+def region_contains(outer, inner):
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    return (inner[0] >= outer[0] and inner[1] >= outer[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3])
+
+def crop_to_region(frame, frame_region, region):
+    frame_left, frame_top = (frame_region[0], frame_region[1]) if frame_region else (0, 0)
+    if region is None or region == frame_region:
+        return frame
+    x, y = region[0] - frame_left, region[1] - frame_top
+    return frame[y:y + region[3], x:x + region[2]]
+
+def box_center(box):
+    return Point(int(box[0] + box[2] / 2), int(box[1] + box[3] / 2))
+
+class VirtualClock:
+    def __init__(self):
+        self.offset = 0.0
+
+    def time(self):
+        return time.time() + self.offset
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.offset += seconds
+
+class PyAutoGuiBackend:
+    realtime = True
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def screenshot(self, region=None):
+        return pyautogui.screenshot(region=region)
+
+    def screen_size(self):
+        return tuple(pyautogui.size())
+
+    def list_windows(self, title):
+        return pyautogui.getWindowsWithTitle(title)
+
+    def launch(self, path, title):
+        os.startfile(path)
+
+    def active_window_title(self):
+        return pyautogui.getActiveWindowTitle()
+
+    def click(self, x, y, button='left'):
+        pyautogui.click(x, y, button=button)
+
+    def double_click(self, x, y):
+        pyautogui.doubleClick(x, y, interval=0.1)
+
+    def drag(self, x, y, x_offset, y_offset, duration=1):
+        pyautogui.moveTo(x, y, duration=0.2)
+        pyautogui.dragRel(x_offset, y_offset, duration=duration, button='left')
+
+    def type_text(self, text, interval=0.05):
+        pyautogui.typewrite(text, interval=interval)
+
+    def hotkey(self, *keys):
+        pyautogui.hotkey(*keys)
+
+    def press(self, key):
+        pyautogui.press(key)
+
+class SimWindow:
+    def __init__(self, backend, title, region):
+        self.backend = backend
+        self.title = title
+        self.left, self.top, self.width, self.height = region
+        self.isMinimized = False
+
+    def activate(self):
+        self.backend.inputs.append(('activate', self.title))
+        self.backend.active_title = self.title
+
+    def restore(self):
+        self.isMinimized = False
+
+    def minimize(self):
+        self.isMinimized = True
+
+    def close(self):
+        self.backend.windows.pop(self.title, None)
+        self.title = ""
+
+class SimulatorBackend:
+    realtime = False
+
+    def __init__(self, scenario_path, templates):
+        self.scenario_path = scenario_path
+        self.templates = templates
+        self.clock = VirtualClock()
+        self._lock = threading.Lock()
+        self.scenario = self.load_scenario()
+        self.reset()
+
+    def load_scenario(self):
+        if not os.path.exists(self.scenario_path):
+            logger.warning(f"Không tìm thấy kịch bản mô phỏng: {self.scenario_path}")
+            return {}
+        try:
+            with open(self.scenario_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi đọc kịch bản mô phỏng: {e}")
+            return {}
+
+    def reset(self):
+        with self._lock:
+            for window in getattr(self, 'windows', {}).values():
+                window.title = ""
+            self.screen = tuple(self.scenario.get('screen', [1920, 1080]))
+            self.windows = {title: SimWindow(self, title, region) for title, region in self.scenario.get('windows', {}).items()}
+            self.state = self.scenario.get('start', 'start')
+            self.inputs = []
+            self.active_title = None
+            self._pending = None
+            self._layouts = {}
+            self._desktops = {}
+
+    def time(self):
+        return self.clock.time()
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+    def _current_state(self):
+        if self._pending and self.clock.time() >= self._pending[1]:
+            self.state, self._pending = self._pending[0], None
+            logger.debug(f"Mô phỏng chuyển sang trạng thái '{self.state}'")
+        return self.state
+
+    def _layout(self, state):
+        layout = self._layouts.get(state)
+        if layout is None:
+            layout = []
+            for element in self.scenario.get('elements', []):
+                if state not in element.get('states', []):
+                    continue
+                templates = self.templates.get(element['key'])
+                if not templates:
+                    logger.warning(f"Mô phỏng: không có ảnh cho '{element['key']}'")
+                    continue
+                layout.append((element, templates[0], element['at'][0], element['at'][1]))
+            self._layouts[state] = layout
+        return layout
+
+    def _desktop(self, state):
+        desktop = self._desktops.get(state)
+        if desktop is None:
+            screen_width, screen_height = self.screen
+            desktop = np.empty((screen_height, screen_width, 3), dtype=np.uint8)
+            desktop[:] = self.scenario.get('background', [0, 0, 0])
+            for element, template, left, top in self._layout(state):
+                height = min(template.height, screen_height - top)
+                width = min(template.width, screen_width - left)
+                if height > 0 and width > 0:
+                    desktop[top:top + height, left:left + width] = template.image[:height, :width, ::-1]
+            self._desktops[state] = desktop
+        return desktop
+
+    def screenshot(self, region=None):
+        with self._lock:
+            desktop = self._desktop(self._current_state())
+        if region:
+            left, top, width, height = region
+            return desktop[top:top + height, left:left + width]
+        return desktop
+
+    def screen_size(self):
+        return self.screen
+
+    def list_windows(self, title):
+        return [window for window_title, window in self.windows.items() if title in window_title]
+
+    def launch(self, path, title):
+        self.inputs.append(('launch', path))
+        region = self.scenario.get('windows', {}).get(title)
+        if region and title not in self.windows:
+            self.windows[title] = SimWindow(self, title, region)
+
+    def active_window_title(self):
+        return self.active_title
+
+    def _on_click(self, x, y):
+        with self._lock:
+            for element, template, left, top in reversed(self._layout(self._current_state())):
+                if not (left <= x < left + template.width and top <= y < top + template.height):
+                    continue
+                target = element.get('click')
+                if isinstance(target, dict):
+                    self._pending = (target['state'], self.clock.time() + target.get('after', 0))
+                elif target:
+                    self.state, self._pending = target, None
+                return
+
+    def click(self, x, y, button='left'):
+        self.inputs.append(('click', x, y))
+        self._on_click(x, y)
+
+    def double_click(self, x, y):
+        self.inputs.append(('double_click', x, y))
+        self._on_click(x, y)
+
+    def drag(self, x, y, x_offset, y_offset, duration=1):
+        self.inputs.append(('drag', x, y, x_offset, y_offset))
+
+    def type_text(self, text, interval=0.05):
+        self.inputs.append(('type_text', text))
+
+    def hotkey(self, *keys):
+        self.inputs.append(('hotkey',) + keys)
+
+    def press(self, key):
+        self.inputs.append(('press', key))
+
+def create_backend(name, templates, scenario_path=None):
+    if name == 'simulator':
+        scenario_path = scenario_path or os.path.join(os.path.dirname(__file__), config_manager.settings.simulator_scenario)
+        logger.info(f"Dùng màn hình mô phỏng: {scenario_path}")
+        return SimulatorBackend(scenario_path, templates)
+    return PyAutoGuiBackend()
+
+class WindowManager:
+    def __init__(self, backend, launch_timeout=15, poll_interval=0.25):
+        self.backend = backend
+        self.launch_timeout = launch_timeout
+        self.poll_interval = poll_interval
+        self._handles = {}
+        self._lock = threading.RLock()
+
+    def title(self, tool):
+        return getattr(config_manager.settings, f'{tool}_title') if tool in WINDOW_TOOLS else tool
+
+    def reset(self):
+        with self._lock:
+            self._handles.clear()
+
+    def find(self, tool):
+        title = self.title(tool)
+        with self._lock:
+            window = self._handles.get(title)
+            if window is not None:
                 try:
-                    time.sleep(self.screenshot_delay)
-                    location = pyautogui.locateOnScreen(image_path, confidence=current_confidence)
-                    if location:
-                        center = pyautogui.center(location)
-                        logger.info(f"Hình ảnh '{os.path.basename(image_path)}' tìm thấy tại {center}. Đang nhấp{' hai lần' if double_click else ''}...")
-                        if double_click:
-                            pyautogui.doubleClick(center.x, center.y, interval=0.1)
-                        else:
-                            pyautogui.click(center.x, center.y, button=button)
-                        time.sleep(self.action_delay)
-                        return True
-                except pyautogui.ImageNotFoundException:
-                    pass 
-                except Exception as e:
-                    logger.error(f"Lỗi bất ngờ với hình ảnh '{os.path.basename(image_path)}': {e}", exc_info=True)
+                    if title in window.title:
+                        return window
+                except Exception:
                     pass
-            time.sleep(0.5) 
+                del self._handles[title]
+            windows = self.backend.list_windows(title)
+            if not windows:
+                return None
+            self._handles[title] = windows[0]
+            return windows[0]
+
+    def ensure(self, tool):
+        window = self.find(tool)
+        if window is not None or tool not in WINDOW_TOOLS:
+            return window
+        title = self.title(tool)
+        exe_path = getattr(config_manager.settings, f'{tool}_exe')
+        logger.info(f"Chưa mở '{title}'. Đang chạy {exe_path}...")
+        try:
+            self.backend.launch(exe_path, title)
+        except OSError as e:
+            logger.error(f"Không chạy được {exe_path}: {e}")
+            return None
+        deadline = self.backend.time() + self.launch_timeout
+        while self.backend.time() < deadline:
+            window = self.find(tool)
+            if window is not None:
+                return window
+            self.backend.sleep(self.poll_interval)
+        logger.warning(f"Không tìm thấy cửa sổ sau khi mở: '{title}'")
+        return None
+
+    def activate(self, tool):
+        window = self.ensure(tool)
+        if window is None:
+            return None
+        if window.isMinimized:
+            window.restore()
+        try:
+            window.activate()
+        except Exception:
+            pass
+        return window
+
+    def minimize(self, tool):
+        window = self.find(tool)
+        if window is not None and not window.isMinimized:
+            window.minimize()
+        return window
+
+    def is_minimized(self, tool):
+        window = self.find(tool)
+        return window is None or window.isMinimized
+
+    def prelaunch(self):
+        for tool in WINDOW_TOOLS:
+            if self.find(tool) is None:
+                window = self.ensure(tool)
+                if window is not None:
+                    window.minimize()
+                    logger.info(f"Đã mở sẵn '{self.title(tool)}'.")
+
+class DirectCaptureStream:
+    def __init__(self, service, region, poll_interval, sleep=time.sleep):
+        self.service = service
+        self.region = region
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self._first = True
+
+    @contextlib.contextmanager
+    def next_frame(self):
+        if not self._first:
+            self.sleep(self.poll_interval)
+        self._first = False
+        yield self.service.grab(self.region)
+
+class SharedCaptureStream:
+    def __init__(self, service, region, poll_interval):
+        self.service = service
+        self.region = region
+        self.poll_interval = poll_interval
+        self.last_seq = 0
+        self.not_before = time.time()
+
+    @contextlib.contextmanager
+    def next_frame(self):
+        lease = self.service.wait_frame(self.last_seq, self.region, timeout=max(self.poll_interval, 1.0), not_before=self.not_before)
+        if lease is None:
+            yield self.service.grab(self.region)
+            return
+        slot, seq, frame_region = lease
+        self.last_seq = seq
+        try:
+            yield crop_to_region(self.service.buffers[slot], frame_region, self.region)
+        finally:
+            self.service.release_frame(slot)
+
+class ScreenCaptureService:
+    def __init__(self, backend, fps=0, buffer_size=4, idle_timeout=2.0):
+        self.backend = backend
+        self.fps = fps
+        self.buffer_size = buffer_size
+        self.idle_timeout = idle_timeout
+        self.buffers = [None] * buffer_size
+        self._leases = [0] * buffer_size
+        self._slot_regions = [None] * buffer_size
+        self._slot_started = [0.0] * buffer_size
+        self._latest = -1
+        self._seq = 0
+        self._region = None
+        self._users = 0
+        self._idle_since = time.time()
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def grab(self, region=None):
+        screenshot = np.asarray(self.backend.screenshot(region=region))
+        if screenshot.ndim == 3 and screenshot.shape[2] == 4:
+            return cv2.cvtColor(screenshot, cv2.COLOR_RGBA2BGR)
+        return cv2.cvtColor(screenshot, cv2.COLOR_RGB2BGR)
+
+    @contextlib.contextmanager
+    def subscribe(self, region, poll_interval, sleep=time.sleep):
+        if self.fps <= 0 or not self.backend.realtime:
+            yield DirectCaptureStream(self, region, poll_interval, sleep)
+            return
+        self._acquire(region)
+        try:
+            yield SharedCaptureStream(self, region, poll_interval)
+        finally:
+            self._release()
+
+    def _acquire(self, region):
+        with self._cond:
+            if self._users == 0:
+                self._region = region
+            elif not region_contains(self._region, region):
+                self._region = self._union(self._region, region)
+            self._users += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _release(self):
+        with self._cond:
+            self._users -= 1
+            if self._users == 0:
+                self._idle_since = time.time()
+
+    def _union(self, a, b):
+        if a is None or b is None:
+            return None
+        left, top = min(a[0], b[0]), min(a[1], b[1])
+        right = max(a[0] + a[2], b[0] + b[2])
+        bottom = max(a[1] + a[3], b[1] + b[3])
+        return (left, top, right - left, bottom - top)
+
+    def wait_frame(self, after_seq, region, timeout=1.0, not_before=0.0):
+        def ready():
+            return (self._latest >= 0 and self._seq > after_seq
+                    and self._slot_started[self._latest] >= not_before
+                    and region_contains(self._slot_regions[self._latest], region))
+        with self._cond:
+            if not self._cond.wait_for(ready, timeout):
+                return None
+            slot = self._latest
+            self._leases[slot] += 1
+            return slot, self._seq, self._slot_regions[slot]
+
+    def release_frame(self, slot):
+        with self._cond:
+            self._leases[slot] -= 1
+
+    def _free_slot(self):
+        for offset in range(1, self.buffer_size + 1):
+            slot = (self._latest + offset) % self.buffer_size
+            if self._leases[slot] == 0:
+                return slot
+        return None
+
+    def _run(self):
+        logger.debug(f"Luồng chụp màn hình bắt đầu ({self.fps} FPS).")
+        while True:
+            with self._cond:
+                if self._users == 0 and time.time() - self._idle_since >= self.idle_timeout:
+                    self._thread = None
+                    self._latest = -1
+                    logger.debug("Luồng chụp màn hình dừng do không còn sử dụng.")
+                    return
+                region = self._region
+            started = time.time()
+            try:
+                screenshot = np.asarray(self.backend.screenshot(region=region))
+            except Exception as e:
+                logger.error(f"Lỗi chụp màn hình nền: {e}")
+                time.sleep(1.0 / self.fps)
+                continue
+            code = cv2.COLOR_RGBA2BGR if screenshot.ndim == 3 and screenshot.shape[2] == 4 else cv2.COLOR_RGB2BGR
+            with self._cond:
+                slot = self._free_slot()
+                if slot is not None:
+                    shape = screenshot.shape[:2] + (3,)
+                    if self.buffers[slot] is None or self.buffers[slot].shape != shape:
+                        self.buffers[slot] = np.empty(shape, dtype=np.uint8)
+                    cv2.cvtColor(screenshot, code, dst=self.buffers[slot])
+                    self._slot_regions[slot] = region
+                    self._slot_started[slot] = started
+                    self._latest = slot
+                    self._seq += 1
+                    self._cond.notify_all()
+            time.sleep(max(1.0 / self.fps - (time.time() - started), 0))
+
+class MatchHistory:
+    def __init__(self, filepath='match_history.json'):
+        self.filepath = os.path.join(os.path.dirname(__file__), filepath)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.data = self.load_history()
+
+    def load_history(self):
+        if not os.path.exists(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi đọc lịch sử khớp ảnh: {e}")
+            return {}
+
+    def save_history(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = copy.deepcopy(self.data)
+            self._dirty = False
+        temp_file = self.filepath + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, indent=4, ensure_ascii=False)
+            os.replace(temp_file, self.filepath)
+        except Exception as e:
+            logger.error(f"Lỗi lưu lịch sử khớp ảnh: {e}")
+
+    def record_hit(self, image_name_key, templates, template, box, score, decay=0.2):
+        with self._lock:
+            entry = self.data.setdefault(image_name_key, {'last_box': None, 'variants': {}})
+            entry['runs'] = entry.get('runs', 0) + 1
+            for candidate in templates:
+                variant = entry['variants'].setdefault(candidate.name, {'hits': 0, 'confidence': 0.0, 'first_run': entry['runs']})
+                hit = 1.0 if candidate is template else 0.0
+                variant['rate'] = round(variant.get('rate', hit) * (1 - decay) + hit * decay, 4)
+            variant = entry['variants'][template.name]
+            variant['hits'] += 1
+            variant['confidence'] = round(float(score), 4)
+            variant['box'] = [int(v) for v in box]
+            variant['last_hit_run'] = entry['runs']
+            entry['last_box'] = [int(v) for v in box]
+            entry['last_variant'] = template.name
+            self._dirty = True
+
+    def _variants(self, image_name_key):
+        with self._lock:
+            entry = self.data.get(image_name_key)
+            if not entry:
+                return 0, None
+            return entry.get('runs', 0), {name: dict(variant) for name, variant in entry['variants'].items()}
+
+    def order_variants(self, image_name_key, templates, stale_after_runs):
+        runs, variants = self._variants(image_name_key)
+        if variants is None or len(templates) < 2:
+            return list(templates), []
+        ranked = sorted(templates, key=lambda t: -variants.get(t.name, {}).get('rate', 0.0))
+        active, stale = [], []
+        for template in ranked:
+            variant = variants.get(template.name)
+            if variant is None:
+                active.append(template)
+                continue
+            last_seen_run = max(variant.get('last_hit_run', 0), variant.get('first_run', 0))
+            if stale_after_runs and runs - last_seen_run >= stale_after_runs:
+                stale.append(template)
+            else:
+                active.append(template)
+        if not active:
+            return stale, []
+        return active, stale
+
+    def get_variant_stats(self, image_name_key):
+        runs, variants = self._variants(image_name_key)
+        if not variants:
+            return {}
+        stats = {}
+        for name, variant in variants.items():
+            stats[name] = {
+                'hits': variant.get('hits', 0),
+                'rate': variant.get('rate', 0.0),
+                'confidence': variant.get('confidence', 0.0),
+                'runs_since_hit': runs - max(variant.get('last_hit_run', 0), variant.get('first_run', 0)),
+            }
+        return stats
+
+    def get_hotspot(self, image_name_key, padding):
+        with self._lock:
+            entry = self.data.get(image_name_key)
+            last_box = entry.get('last_box') if entry else None
+        if not last_box:
+            return None
+        left, top, width, height = last_box
+        return (left - padding, top - padding, width + 2 * padding, height + 2 * padding)
+
+class AddressTable:
+    COLUMNS = ('No.', 'Pump', 'Led', 'Dmx2Vfd')
+    INDEXED_COLUMNS = ('Pump', 'Led', 'Dmx2Vfd')
+    MISSING = -(2 ** 63)
+
+    def __init__(self):
+        self.columns = {name: array('q') for name in self.COLUMNS}
+        self.indexes = {name: {} for name in self.INDEXED_COLUMNS}
+        self.row_count = 0
+
+    @classmethod
+    def from_excel(cls, file_path):
+        import openpyxl
+        table = cls()
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(min_row=2, max_col=len(cls.COLUMNS), values_only=True)
+            for values in rows:
+                if all(v is None or (isinstance(v, str) and not v.strip()) for v in values):
+                    continue
+                table.append(values)
+        finally:
+            workbook.close()
+        return table
+
+    def _coerce(self, value):
+        if value is None:
+            return self.MISSING
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                return self.MISSING
+            try:
+                return int(value)
+            except ValueError:
+                return value
+        return value
+
+    def append(self, values):
+        values = list(values) + [None] * (len(self.COLUMNS) - len(values))
+        row = self.row_count
+        for name, value in zip(self.COLUMNS, values):
+            value = self._coerce(value)
+            column = self.columns[name]
+            if isinstance(column, array) and not isinstance(value, int):
+                column = self.columns[name] = [None if v == self.MISSING else v for v in column]
+            column.append(value)
+            if name in self.indexes and value != self.MISSING and value is not None:
+                self.indexes[name].setdefault(value, row)
+        self.row_count += 1
+
+    def _value(self, name, row):
+        value = self.columns[name][row]
+        return None if value == self.MISSING else value
+
+    def find_row(self, column, value):
+        return self.indexes[column].get(value)
+
+    def __len__(self):
+        return self.row_count
+
+    def __bool__(self):
+        return self.row_count > 0
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.row_count
+        if not 0 <= row < self.row_count:
+            raise IndexError(row)
+        return {name: self._value(name, row) for name in self.COLUMNS}
+
+    def __iter__(self):
+        for row in range(self.row_count):
+            yield self[row]
+
+class BatchCheckpoint:
+    def __init__(self, filepath='batch_checkpoint.json'):
+        self.filepath = os.path.join(os.path.dirname(__file__), filepath)
+        self.data = self.load_checkpoint()
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi đọc checkpoint batch: {e}")
+            return {}
+
+    def save_checkpoint(self):
+        temp_file = self.filepath + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=4, ensure_ascii=False)
+            os.replace(temp_file, self.filepath)
+        except Exception as e:
+            logger.error(f"Lỗi lưu checkpoint batch: {e}")
+
+    def get_next_row(self, excel_path, total_rows):
+        entry = self.data.get(os.path.abspath(excel_path)) if excel_path else None
+        if not entry or entry.get('total') != total_rows or entry['last_completed_row'] + 1 >= total_rows:
+            return None
+        return entry['last_completed_row'] + 1
+
+    def mark_completed(self, excel_path, row, total_rows):
+        if not excel_path:
+            return
+        self.data[os.path.abspath(excel_path)] = {
+            'last_completed_row': row,
+            'total': total_rows,
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.save_checkpoint()
+
+    def clear(self, excel_path):
+        if excel_path and self.data.pop(os.path.abspath(excel_path), None) is not None:
+            self.save_checkpoint()
+
+class UIState:
+    def __init__(self):
+        self.active_window = None
+        self.facts = {}
+
+    def set_fact(self, fact, value, frame_key=None):
+        self.facts[fact] = (bool(value), frame_key)
+
+    def get_fact(self, fact, frame_key):
+        value, seen_on = self.facts.get(fact, (None, None))
+        if seen_on is None or seen_on != frame_key:
+            return None
+        return value
+
+class RunProfiler:
+    def __init__(self, filepath='run_profile.jsonl'):
+        self.filepath = os.path.join(os.path.dirname(__file__), filepath)
+        self.last_report = None
+        self._run = None
+        self._step = None
+        self._call = None
+        self._depth = 0
+        self._slept = 0.0
+        self._thread_id = None
+        self.sleep_func = time.sleep
+
+    def _active(self):
+        return self._run is not None and threading.get_ident() == self._thread_id
+
+    def start_run(self, category, script_name):
+        self._thread_id = threading.get_ident()
+        self._run = {
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'category': category,
+            'script': script_name,
+            'steps': [],
+            '_start': time.perf_counter(),
+        }
+
+    @contextlib.contextmanager
+    def step(self, name):
+        if not self._active():
+            yield
+            return
+        self._step = {'name': name, 'wall': 0.0, 'capture': 0.0, 'match': 0.0, 'sleep': 0.0, 'retries': 0, 'calls': []}
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._step['wall'] = time.perf_counter() - started
+            self._run['steps'].append(self._step)
+            self._step = None
+
+    @contextlib.contextmanager
+    def call(self, method, image_name_key=None):
+        if not self._active() or self._step is None:
+            yield
+            return
+        self._depth += 1
+        if self._depth > 1:
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        self._call = {'method': method, 'key': image_name_key, 'wall': 0.0, 'capture': 0.0, 'match': 0.0, 'sleep': 0.0, 'retries': 0}
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._call['wall'] = time.perf_counter() - started
+            self._step['calls'].append(self._call)
+            self._call = None
+            self._depth -= 1
+
+    def add(self, kind, seconds):
+        if not self._active():
+            return
+        target = self._call or self._step
+        if target is not None:
+            target[kind] += seconds
+
+    @contextlib.contextmanager
+    def measure(self, kind):
+        started = time.perf_counter()
+        slept = self._slept
+        try:
+            yield
+        finally:
+            self.add(kind, time.perf_counter() - started - (self._slept - slept))
+
+    def sleep(self, seconds):
+        started = time.perf_counter()
+        self.sleep_func(seconds)
+        elapsed = time.perf_counter() - started
+        if self._active():
+            self._slept += elapsed
+        self.add('sleep', elapsed)
+
+    def finish_run(self, results):
+        if self._run is None:
+            return None
+        run, self._run = self._run, None
+        run['wall'] = time.perf_counter() - run.pop('_start')
+        run['results'] = [str(r) for r in results]
+        totals = {'capture': 0.0, 'match': 0.0, 'sleep': 0.0, 'retries': 0}
+        keys = {}
+        for step in run['steps']:
+            for call in step['calls']:
+                for kind in totals:
+                    step[kind] += call[kind]
+                if call['key']:
+                    keys[call['key']] = keys.get(call['key'], 0.0) + call['wall']
+            for kind in totals:
+                totals[kind] += step[kind]
+        run['totals'] = totals
+        run['keys'] = dict(sorted(keys.items(), key=lambda kv: -kv[1]))
+        try:
+            with open(self.filepath, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        except IOError as e:
+            logger.error(f"Lỗi ghi báo cáo thời gian chạy: {e}")
+        self.last_report = run
+        return run
+
+class ProfiledTime:
+    def __init__(self, profiler, clock=time.time):
+        self._profiler = profiler
+        self._clock = clock
+
+    def sleep(self, seconds):
+        self._profiler.sleep(seconds)
+
+    def time(self):
+        return self._clock()
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+def to_jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+class SessionRecorder:
+    def __init__(self, folder='recordings', enabled=False):
+        self.folder = os.path.join(os.path.dirname(__file__), folder)
+        self.enabled = enabled
+        self._session = None
+        self._call = None
+        self._depth = 0
+        self._thread_id = None
+        self._frame_files = {}
+
+    def _active(self):
+        return self._session is not None and threading.get_ident() == self._thread_id
+
+    def start_run(self, category, script_name, steps, extra_context):
+        if not self.enabled:
+            return
+        self._thread_id = threading.get_ident()
+        session_dir = os.path.join(self.folder, f"{time.strftime('%Y%m%d-%H%M%S')}_{category}")
+        try:
+            os.makedirs(os.path.join(session_dir, 'frames'), exist_ok=True)
+        except OSError as e:
+            logger.error(f"Không thể tạo thư mục ghi phiên: {e}")
+            return
+        screen_width, screen_height = acs_auto.backend.screen_size()
+        self._frame_files = {}
+        self._session = {
+            'dir': session_dir,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'category': category,
+            'script': script_name,
+            'steps': steps,
+            'context': to_jsonable(extra_context),
+            'excel_row_index': acs_auto.current_excel_row_index,
+            'excel_rows': len(acs_auto.excel_data) if acs_auto.excel_data else 0,
+            'match_history': copy.deepcopy(acs_auto.match_history.data),
+            'screen': [screen_width, screen_height],
+            'windows': {},
+            'calls': [],
+        }
+
+    def record_window(self, title, region):
+        if self._active() and region:
+            self._session['windows'][title] = list(region)
+
+    @contextlib.contextmanager
+    def call(self, method, image_name_key=None):
+        if not self._active():
+            yield self
+            return
+        self._depth += 1
+        if self._depth > 1:
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+            return
+        self._call = {'method': method, 'key': image_name_key, 'frames': [], 'result': None}
+        try:
+            yield self
+        finally:
+            self._session['calls'].append(self._call)
+            self._call = None
+            self._depth -= 1
+
+    def set_result(self, result):
+        if self._active() and self._call is not None and self._depth == 1:
+            self._call['result'] = to_jsonable(result)
+
+    def frame(self, frame, region):
+        if not self._active() or self._call is None:
+            return
+        digest = hashlib.blake2b(frame.tobytes(), digest_size=16).hexdigest()
+        filename = self._frame_files.get(digest)
+        if filename is None:
+            filename = f"{len(self._frame_files):05d}.png"
+            try:
+                cv2.imencode('.png', frame)[1].tofile(os.path.join(self._session['dir'], 'frames', filename))
+            except Exception as e:
+                logger.error(f"Lỗi lưu khung hình: {e}")
+                return
+            self._frame_files[digest] = filename
+        self._call['frames'].append({'file': filename, 'region': list(region) if region else None})
+
+    def finish_run(self, results, report=None):
+        if self._session is None:
+            return None
+        session, self._session = self._session, None
+        session_dir = session.pop('dir')
+        session['results'] = [str(r) for r in results]
+        session['profile'] = report
+        try:
+            with open(os.path.join(session_dir, 'session.json'), 'w', encoding='utf-8') as f:
+                json.dump(session, f, indent=4, ensure_ascii=False)
+            logger.info(f"Đã ghi phiên chạy vào: {session_dir}")
+        except IOError as e:
+            logger.error(f"Lỗi ghi phiên chạy: {e}")
+        return session_dir
+
+def traced(method=None, key_arg=None):
+    if method is None:
+        return functools.partial(traced, key_arg=key_arg)
+    signature = inspect.signature(method) if key_arg else None
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = signature.bind(self, *args, **kwargs).arguments.get(key_arg) if signature else None
+        if isinstance(key, (list, tuple)):
+            key = '+'.join(k for k in key if isinstance(k, str)) or None
+        elif not isinstance(key, str):
+            key = None
+        with self.profiler.call(method.__name__, key), self.recorder.call(method.__name__, key) as recorder:
+            result = method(self, *args, **kwargs)
+            recorder.set_result(result)
+            return result
+    return wrapper
+
+class LiveSetting:
+    def __init__(self, key):
+        self.key = key
+
+    def __get__(self, instance, owner):
+        return getattr(config_manager.settings, self.key)
+
+class ACSAutomation:
+    screenshot_delay = LiveSetting('screenshot_delay_sec')
+    action_delay = LiveSetting('action_delay_sec')
+    confidence = LiveSetting('find_image_confidence')
+    hotspot_padding = LiveSetting('hotspot_padding_px')
+    variant_stale_runs = LiveSetting('variant_stale_runs')
+    pyramid_scale = LiveSetting('pyramid_scale')
+    pyramid_coarse_confidence = LiveSetting('pyramid_coarse_confidence')
+    pyramid_candidates = LiveSetting('pyramid_candidates')
+
+    def __init__(self):
+        self.icon_folder = os.path.join(os.path.dirname(__file__), config_manager.settings.icon_folder)
+        self.image_folder = os.path.join(os.path.dirname(__file__), config_manager.settings.image_folder)
+        self.rematch_interval = 1.0
+
+        self.templates = TemplateCache(self.image_folder)
+        self.match_history = MatchHistory()
+        self.backend = create_backend(config_manager.settings.backend, self.templates)
+        self.capture = ScreenCaptureService(self.backend, fps=config_manager.settings.capture_fps)
+        self.windows = WindowManager(self.backend)
+        self.profiler = RunProfiler()
+        self.profiler.sleep_func = self.backend.sleep
+        self.recorder = SessionRecorder(enabled=config_manager.settings.record_sessions)
+
+        self.excel_data = None
+        self.excel_file_path = None
+        self.current_excel_row_index = 0
+        self.batch_checkpoint = BatchCheckpoint()
+        self.ui_state = UIState()
+        self.last_frame_key = None
+
+        self.stop_requested = False
+        self.enable_auto_increment = True
+
+        self.search_window_title = None
+
+    def _get_image_paths_list(self, image_name_key):
+        return self.templates.get_image_paths(image_name_key)
+
+    def set_search_window(self, title):
+        self.search_window_title = title
+        self.ui_state.active_window = title
+        logger.info(f"Giới hạn vùng tìm kiếm trong cửa sổ: '{title}'")
+
+    def warm_up(self):
+        names = ['numpy', 'cv2'] + (['pyautogui'] if isinstance(self.backend, PyAutoGuiBackend) else [])
+        errors = {}
+        for name in names:
+            try:
+                lazy_modules[name].load()
+            except Exception as e:
+                logger.error(f"Lỗi tải thư viện {name}: {e}")
+                errors[name] = e
+        if errors:
+            return errors
+        logger.info(f"Đã tải nền thư viện: {startup.lazy_summary()}")
+        self.templates.preload()
+        return errors
+
+    def set_backend(self, backend):
+        self.backend = backend
+        self.capture.backend = backend
+        self.windows.backend = backend
+        self.windows.reset()
+        self.profiler.sleep_func = backend.sleep
+
+    def switch_window(self, tool):
+        window = self.windows.activate(tool)
+        if window is None:
+            logger.warning(f"Không tìm thấy cửa sổ: '{self.windows.title(tool)}'")
+            return False
+        self.set_search_window(self.windows.title(tool))
+        return True
+
+    def clear_search_window(self):
+        self.search_window_title = None
+
+    def _clip_region(self, left, top, width, height):
+        screen_width, screen_height = self.backend.screen_size()
+        right = min(left + width, screen_width)
+        bottom = min(top + height, screen_height)
+        left = max(left, 0)
+        top = max(top, 0)
+        if right - left <= 0 or bottom - top <= 0:
+            return None
+        return (int(left), int(top), int(right - left), int(bottom - top))
+
+    def _get_window_region(self):
+        if not self.search_window_title:
+            return None
+        try:
+            window = self.windows.find(self.search_window_title)
+        except Exception as e:
+            logger.debug(f"Lỗi khi tìm cửa sổ '{self.search_window_title}': {e}", extra=SAMPLED)
+            return None
+        if window is None or window.isMinimized:
+            logger.debug(f"Không tìm thấy cửa sổ '{self.search_window_title}', tìm trên toàn màn hình.", extra=SAMPLED)
+            return None
+        region = self._clip_region(window.left, window.top, window.width, window.height)
+        self.recorder.record_window(self.search_window_title, region)
+        return region
+
+    def _get_key_subregion(self, image_name_key):
+        if not image_name_key or not config_manager.config.has_option('SEARCH_REGIONS', image_name_key):
+            return None
+        raw_val = config_manager.config.get('SEARCH_REGIONS', image_name_key)
+        try:
+            x, y, w, h = [int(v.strip()) for v in raw_val.split(',')]
+            return x, y, w, h
+        except ValueError:
+            logger.warning(f"Vùng tìm kiếm '{image_name_key}' không hợp lệ: '{raw_val}' (cần dạng x, y, rộng, cao)")
+            return None
+
+    def _resolve_search_region(self, image_name_key=None):
+        window_region = self._get_window_region()
+        if not window_region:
+            return None
+        subregion = self._get_key_subregion(image_name_key)
+        if not subregion:
+            return window_region
+        x, y, w, h = subregion
+        return self._intersect_regions((window_region[0] + x, window_region[1] + y, w, h), window_region) or window_region
+
+    def _intersect_regions(self, region, bounds):
+        left = max(region[0], bounds[0])
+        top = max(region[1], bounds[1])
+        right = min(region[0] + region[2], bounds[0] + bounds[2])
+        bottom = min(region[1] + region[3], bounds[1] + bounds[3])
+        if right - left <= 0 or bottom - top <= 0:
+            return None
+        return (left, top, right - left, bottom - top)
+
+    def _get_search_regions(self, image_name_key, search_region):
+        regions = []
+        hotspot = self.match_history.get_hotspot(image_name_key, self.hotspot_padding)
+        if hotspot:
+            if search_region:
+                hotspot = self._intersect_regions(hotspot, search_region)
+            else:
+                hotspot = self._clip_region(*hotspot)
+            if hotspot and hotspot != search_region:
+                regions.append(hotspot)
+        regions.append(search_region)
+        return regions
+
+    def _capture_screen(self, region=None):
+        frame = self.capture.grab(region)
+        self.recorder.frame(frame, region)
+        return frame
+
+    @contextlib.contextmanager
+    def _next_frame(self, stream):
+        with contextlib.ExitStack() as stack:
+            with self.profiler.measure('capture'):
+                frame = stack.enter_context(stream.next_frame())
+            self.recorder.frame(frame, stream.region)
+            yield frame
+
+    def _match_template(self, frame, template, confidence, coarse_frame=None):
+        t_h, t_w = template.height, template.width
+        if t_h > frame.shape[0] or t_w > frame.shape[1]:
+            return None, 0.0
+        if coarse_frame is not None:
+            coarse_template = template.scaled(self.pyramid_scale)
+            if coarse_template is not None:
+                return self._match_coarse_to_fine(frame, coarse_frame, template, coarse_template, confidence)
+        scores = cv2.matchTemplate(frame, template.image, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(scores)
+        if max_val < confidence:
+            return None, max_val
+        return Box(max_loc[0], max_loc[1], t_w, t_h), max_val
+
+    def _match_coarse_to_fine(self, frame, coarse_frame, template, coarse_template, confidence):
+        scale = self.pyramid_scale
+        c_h, c_w = coarse_template.shape[:2]
+        if c_h > coarse_frame.shape[0] or c_w > coarse_frame.shape[1]:
+            return None, 0.0
+        scores = cv2.matchTemplate(coarse_frame, coarse_template, cv2.TM_CCOEFF_NORMED)
+        best_box, best_score = None, 0.0
+        candidates = score_map_peaks(scores, self.pyramid_coarse_confidence, (c_w // 2, c_h // 2), self.pyramid_candidates)
+        for c_x, c_y in zip(candidates[0].tolist(), candidates[1].tolist()):
+            pad = scale * 2
+            left, top = max(c_x * scale - pad, 0), max(c_y * scale - pad, 0)
+            window = frame[top:c_y * scale + template.height + pad, left:c_x * scale + template.width + pad]
+            if window.shape[0] < template.height or window.shape[1] < template.width:
+                continue
+            fine_scores = cv2.matchTemplate(window, template.image, cv2.TM_CCOEFF_NORMED)
+            _, fine_score, _, (f_x, f_y) = cv2.minMaxLoc(fine_scores)
+            if fine_score > best_score:
+                best_box, best_score = Box(left + f_x, top + f_y, template.width, template.height), fine_score
+        if best_score < confidence:
+            return None, best_score
+        return best_box, best_score
+
+    def _coarse_frame(self, frame):
+        if self.pyramid_scale <= 1:
+            return None
+        height, width = frame.shape[:2]
+        return cv2.resize(frame, (width // self.pyramid_scale, height // self.pyramid_scale), interpolation=cv2.INTER_AREA)
+
+    def _locate_in_frame(self, frame, templates, confidence, offset=(0, 0)):
+        coarse_frame = self._coarse_frame(frame)
+        for template in templates:
+            box, score = self._match_template(frame, template, confidence, coarse_frame)
+            if box:
+                return Box(box.left + offset[0], box.top + offset[1], box.width, box.height), template, score
+        return None, None, 0.0
+
+    def _locate_key_in_frame(self, image_name_key, templates, confidence, frame, regions):
+        active, stale = self.match_history.order_variants(image_name_key, templates, self.variant_stale_runs)
+        frame_region = regions[-1]
+        for i, region in enumerate(regions):
+            crop = crop_to_region(frame, frame_region, region)
+            offset = (region[0], region[1]) if region else (0, 0)
+            location, template, score = self._locate_in_frame(crop, active, confidence, offset)
+            if not location and stale and i == len(regions) - 1:
+                location, template, score = self._locate_in_frame(crop, stale, confidence, offset)
+                if location:
+                    logger.info(f"Biến thể ít dùng '{template.name}' của '{image_name_key}' vừa khớp lại.")
+            if location:
+                self.match_history.record_hit(image_name_key, templates, template, location, score)
+                return location, template
+        return None
+
+    def _frame_signature(self, frame):
+        small = cv2.resize(frame, (max(frame.shape[1] // 4, 1), max(frame.shape[0] // 4, 1)), interpolation=cv2.INTER_AREA)
+        return hashlib.blake2b((small >> 2).tobytes(), digest_size=8).digest()
+
+    def screen_signature(self, region=None):
+        return self._frame_signature(self._capture_screen(region))
+
+    def _sleep(self, seconds):
+        self.profiler.sleep(seconds)
+
+    def _wait_for_match(self, match_frame, region, timeout):
+        start_time = self.backend.time()
+        last_signature = None
+        last_match_time = 0.0
+        attempts = 0
+        self.last_frame_key = None
+        with self.capture.subscribe(region, self.screenshot_delay, self._sleep) as stream:
+            while not self.stop_requested:
+                with self._next_frame(stream) as frame:
+                    signature = self._frame_signature(frame)
+                    now = self.backend.time()
+                    if signature != last_signature or now - last_match_time >= self.rematch_interval:
+                        last_signature, last_match_time = signature, now
+                        if attempts:
+                            self.profiler.add('retries', 1)
+                        attempts += 1
+                        with self.profiler.measure('match'):
+                            result = match_frame(frame)
+                        self.last_frame_key = (region, signature)
+                        if result:
+                            return result
+                if now - start_time >= timeout:
+                    return None
+        return None
+
+    @traced
+    def wait_until_changed(self, region=None, timeout=5, since=None):
+        search_region = region or self._resolve_search_region()
+        start_time = self.backend.time()
+        baseline = since
+        with self.capture.subscribe(search_region, self.screenshot_delay, self._sleep) as stream:
+            while self.backend.time() - start_time < timeout:
+                if self.stop_requested:
+                    return "Đã dừng."
+                with self._next_frame(stream) as frame:
+                    signature = self._frame_signature(frame)
+                if baseline is None:
+                    baseline = signature
+                elif signature != baseline:
+                    return True
+        return False
+
+    def _wait_for_key(self, image_name_key, templates, confidence, region, timeout):
+        search_regions = self._get_search_regions(image_name_key, region or self._resolve_search_region(image_name_key))
+        return self._wait_for_match(
+            lambda frame: self._locate_key_in_frame(image_name_key, templates, confidence, frame, search_regions),
+            search_regions[-1], timeout)
+
+    @traced(key_arg='image_name_key')
+    def find_and_click(self, image_name_key, timeout=30, button='left', double_click=False, confidence_override=None, region=None):
+        templates = self.templates.get(image_name_key)
+        if not templates:
+            return False
+
+        current_confidence = confidence_override if confidence_override is not None else self.confidence
+        logger.info(f"Đang tìm kiếm bất kỳ hình ảnh nào trong {image_name_key} (thời gian chờ={timeout}s, độ tin cậy={current_confidence})", extra=SAMPLED)
+        try:
+            match = self._wait_for_key(image_name_key, templates, current_confidence, region, timeout)
+            if match:
+                location, template = match
+                center = box_center(location)
+                logger.info(f"Hình ảnh '{template.name}' tìm thấy tại {center}. Đang nhấp{' hai lần' if double_click else ''}...")
+                if double_click:
+                    self.backend.double_click(center.x, center.y)
+                else:
+                    self.backend.click(center.x, center.y, button=button)
+                self._sleep(self.action_delay)
+                return True
+        except Exception as e:
+            logger.error(f"Lỗi bất ngờ khi tìm '{image_name_key}': {e}", exc_info=True)
+            return False
+        if self.stop_requested:
+            return "Đã dừng."
         logger.warning(f"Không tìm thấy bất kỳ hình ảnh nào cho '{image_name_key}' sau {timeout} giây.")
         return False
 
 
+    @traced(key_arg='image_name_key')
     def type_text(self, text, image_name_key=None, timeout=10, select_all_first=False):
         if image_name_key:
             if not self.find_and_click(image_name_key, timeout=timeout):
@@ -214,60 +1804,117 @@ class ACSAutomation:
         logger.info(f"Đang gõ văn bản: '{text}'")
         try:
             if select_all_first:
-                pyautogui.hotkey('ctrl', 'a')
-                time.sleep(0.1)
-            pyautogui.typewrite(str(text), interval=0.05)
-            time.sleep(self.action_delay)
+                self.backend.hotkey('ctrl', 'a')
+                self._sleep(0.1)
+            self.backend.type_text(str(text), interval=0.05)
+            self._sleep(self.action_delay)
             return True
         except Exception as e:
             logger.error(f"Lỗi khi gõ văn bản '{text}': {e}")
             return False
 
+    @traced
     def press_key(self, key):
         logger.info(f"Đang nhấn phím: '{key}'")
         try:
-            pyautogui.press(key)
-            time.sleep(self.action_delay)
+            self.backend.press(key)
+            self._sleep(self.action_delay)
             return True
         except Exception as e:
             logger.error(f"Lỗi khi nhấn phím '{key}': {e}")
             return False
 
-    def wait_for_image(self, image_name_key, timeout=30, confidence_override=None):
-        image_paths = self._get_image_paths_list(image_name_key)
-        if not image_paths:
+    @traced(key_arg='image_name_key')
+    def wait_for_image(self, image_name_key, timeout=30, confidence_override=None, region=None):
+        templates = self.templates.get(image_name_key)
+        if not templates:
             return False
 
         current_confidence = confidence_override if confidence_override is not None else self.confidence
-        logger.info(f"Đang chờ bất kỳ hình ảnh nào trong {image_name_key} (thời gian chờ={timeout}s, độ tin cậy={current_confidence})")
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self.stop_requested:
-                return "Đã dừng."
-
-            for image_path in image_paths:
-                try:
-                    time.sleep(self.screenshot_delay)
-                    location = pyautogui.locateOnScreen(image_path, confidence=current_confidence)
-                    if location:
-                        logger.info(f"Hình ảnh '{os.path.basename(image_path)}' đã tìm thấy.")
-                        return True
-                except pyautogui.ImageNotFoundException:
-                    pass
-                except Exception as e:
-                    logger.error(f"Lỗi khi chờ hình ảnh {os.path.basename(image_path)}: {e}")
-                    return False
-            time.sleep(0.5)
+        logger.info(f"Đang chờ bất kỳ hình ảnh nào trong {image_name_key} (thời gian chờ={timeout}s, độ tin cậy={current_confidence})", extra=SAMPLED)
+        try:
+            match = self._wait_for_key(image_name_key, templates, current_confidence, region, timeout)
+            if match:
+                logger.info(f"Hình ảnh '{match[1].name}' đã tìm thấy.")
+                self._note_ui_state(image_name_key, True, self.last_frame_key)
+                return True
+        except Exception as e:
+            logger.error(f"Lỗi khi chờ hình ảnh '{image_name_key}': {e}")
+            return False
+        if self.stop_requested:
+            return "Đã dừng."
+        self._note_ui_state(image_name_key, False, self.last_frame_key)
         logger.warning(f"Không tìm thấy bất kỳ hình ảnh nào cho '{image_name_key}' sau {timeout} giây.")
         return False
     
     
+    def _note_ui_state(self, image_name_key, found, frame_key=None):
+        if image_name_key in UI_STATE_FACTS:
+            self.ui_state.set_fact(UI_STATE_FACTS[image_name_key], found, frame_key)
+
+    @traced(key_arg='image_name_keys')
+    def probe_keys(self, image_name_keys, confidence_override=None):
+        current_confidence = confidence_override if confidence_override is not None else self.confidence
+        window_region = self._resolve_search_region()
+        frame = self._capture_screen(window_region)
+        frame_key = (window_region, self._frame_signature(frame))
+        found = {}
+        for key in image_name_keys:
+            cached = self.ui_state.get_fact(UI_STATE_FACTS[key], frame_key) if key in UI_STATE_FACTS else None
+            if cached is not None:
+                found[key] = cached
+                continue
+            templates = self.templates.get(key)
+            if not templates:
+                found[key] = False
+                continue
+            regions = self._get_search_regions(key, self._resolve_search_region(key))
+            crop = crop_to_region(frame, window_region, regions[-1])
+            found[key] = self._locate_key_in_frame(key, templates, current_confidence, crop, regions) is not None
+            self._note_ui_state(key, found[key], frame_key)
+        return found
+
+    def postconditions_hold(self, conditions):
+        previous_title = self.search_window_title
+        try:
+            holds = self._check_postconditions(conditions)
+        except Exception as e:
+            logger.debug(f"Lỗi khi kiểm tra trạng thái giao diện: {e}")
+            holds = False
+        if not holds:
+            self.search_window_title = previous_title
+        return holds
+
+    def _check_postconditions(self, conditions):
+        image_facts = {fact: bool(expected) for fact, expected in conditions.items() if fact in UI_STATE_KEYS}
+        unknown = set(conditions) - set(image_facts) - {'window_closed', 'window_minimized', 'active_window'}
+        if unknown:
+            logger.warning(f"Điều kiện trạng thái không hợp lệ: {', '.join(sorted(unknown))}")
+            return False
+        if 'window_closed' in conditions and self.windows.find(conditions['window_closed']):
+            return False
+        if 'window_minimized' in conditions and not self.windows.is_minimized(conditions['window_minimized']):
+            return False
+        if conditions.get('active_window'):
+            title = self.windows.title(conditions['active_window'])
+            if self.ui_state.active_window != title:
+                return False
+            window = self.windows.find(title)
+            if window is None or window.isMinimized:
+                return False
+            active_title = self.backend.active_window_title()
+            if active_title is not None and title not in active_title:
+                return False
+            self.search_window_title = title
+        if image_facts:
+            found = self.probe_keys([UI_STATE_KEYS[fact] for fact in image_facts])
+            return all(found[UI_STATE_KEYS[fact]] == expected for fact, expected in image_facts.items())
+        return True
+
     def import_excel_data(self, file_path):
         try:
-            df = pd.read_excel(file_path, header=0)
-            df = df.iloc[:, [0, 1, 2, 3]]
-            df.columns = ['No.', 'Pump', 'Led', 'Dmx2Vfd']
-            self.excel_data = df.to_dict('records')
+            self.excel_data = AddressTable.from_excel(file_path)
+            self.excel_file_path = file_path
             self.current_excel_row_index = 0
             logger.info(f"Đã nhập {len(self.excel_data)} hàng từ file Excel: {file_path}")
             return True
@@ -290,16 +1937,45 @@ class ACSAutomation:
             return True
         return False
 
+    def _locate_all_in_frame(self, frame, templates, confidence, offset=(0, 0)):
+        all_boxes, all_scores, all_variants = [], [], []
+        for template in templates:
+            if template.height > frame.shape[0] or template.width > frame.shape[1]:
+                continue
+            scores = cv2.matchTemplate(frame, template.image, cv2.TM_CCOEFF_NORMED)
+            xs, ys, peak_scores = score_map_peaks(scores, confidence, (template.width // 2, template.height // 2))
+            if not len(ys):
+                continue
+            boxes = np.empty((len(ys), 4), dtype=np.int64)
+            boxes[:, 0], boxes[:, 1] = xs + offset[0], ys + offset[1]
+            boxes[:, 2], boxes[:, 3] = template.width, template.height
+            all_boxes.append(boxes)
+            all_scores.append(peak_scores)
+            all_variants.extend([template.name] * len(ys))
+        if not all_boxes:
+            return []
+        boxes = np.concatenate(all_boxes)
+        scores = np.concatenate(all_scores)
+        keep = non_max_suppression(boxes, scores)
+        matches = [Match(int(boxes[i, 0]), int(boxes[i, 1]), int(boxes[i, 2]), int(boxes[i, 3]), float(scores[i]), all_variants[i]) for i in keep]
+        matches.sort(key=lambda m: (m.top, m.left))
+        return matches
+
+    @traced(key_arg='image_name_keys')
+    def locate_all_many(self, image_name_keys, region=None, confidence_override=None, frame=None):
+        current_confidence = confidence_override if confidence_override is not None else self.confidence
+        if frame is None:
+            frame = self._capture_screen(region)
+        offset = (region[0], region[1]) if region else (0, 0)
+        results = {}
+        for key in image_name_keys:
+            results[key] = self._locate_all_in_frame(frame, self.templates.get(key), current_confidence, offset)
+        return results
+
+    @traced
     def xac_dinh_vi_tri_thiet_bi(self, timeout=10):
-        search_region = None
-
-        led_locations = []
-        pump_locations = []
-        dmx2vfd_locations = []
-
-        led_image_paths = self._get_image_paths_list('tricolor_led_item')
-        pump_image_paths = self._get_image_paths_list('afvarionaut_pump_item')
-        dmx2vfd_image_paths = self._get_image_paths_list('dmx2vfd_item')
+        search_region = self._resolve_search_region()
+        device_keys = ['tricolor_led_item', 'afvarionaut_pump_item', 'dmx2vfd_item']
 
         locate_confidence = min(0.75, self.confidence * 0.9)
         if locate_confidence < 0.6:
@@ -307,99 +1983,41 @@ class ACSAutomation:
 
         logger.info(f"Vị trí thiết bị bắt đầu trong cửa sổ Discover (thời gian chờ = {timeout} s, độ tin cậy = {locate_confidence})")
 
-        def dedupe_and_sort(locs, min_distance=8):
-            unique = []
-            centers = []
-            for loc in locs:
-                center = pyautogui.center(loc)
-                is_new = True
-                for c in centers:
-                    if abs(center.x - c.x) <= min_distance and abs(center.y - c.y) <= min_distance:
-                        is_new = False
-                        break
-                if is_new:
-                    unique.append(loc)
-                    centers.append(center)
-            unique.sort(key=lambda r: (r.top, r.left))
-            return unique
-
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-        
-            current_iteration_led_locs = []
-            for led_path in led_image_paths:
-                try:
-                    if search_region:
-                        found_locs = list(pyautogui.locateAllOnScreen(led_path, confidence=locate_confidence, region=search_region))
-                    else:
-                        found_locs = list(pyautogui.locateAllOnScreen(led_path, confidence=locate_confidence))
-
-                    if found_locs:
-                        current_iteration_led_locs.extend(found_locs)
+        def locate_devices(frame):
+            found = self.locate_all_many(device_keys, search_region, locate_confidence, frame=frame)
+            if any(found.values()):
+                return found
+            return None
 
-                except pyautogui.ImageNotFoundException:
-                    logger.debug(f"Hình ảnh LED '{os.path.basename(led_path)}' không tìm thấy, đang thử tiếp nếu có sẵn.")
-                    pass
-                except Exception as e:
-                    logger.error(f"Lỗi khi xác định vị trí hình ảnh LED '{os.path.basename(led_path)}': {e}", exc_info=True)
-                    pass
-            
-            current_iteration_pump_locs = []
-            for pump_path in pump_image_paths:
-                try:
-                    if search_region:
-                        found_locs = list(pyautogui.locateAllOnScreen(pump_path, confidence=locate_confidence, region=search_region))
-                    else:
-                        found_locs = list(pyautogui.locateAllOnScreen(pump_path, confidence=locate_confidence))
-                    if found_locs:
-                        current_iteration_pump_locs.extend(found_locs)
-                except pyautogui.ImageNotFoundException:
-                    logger.debug(f"Hình ảnh PUMP '{os.path.basename(pump_path)}' không tìm thấy, đang thử tiếp nếu có sẵn.")
-                    pass
-                except Exception as e:
-                    logger.error(f"Lỗi khi xác định vị trí hình ảnh PUMP '{os.path.basename(pump_path)}': {e}", exc_info=True)
-                    pass
-            
-            current_iteration_dmx2vfd_locs = []
-            for dmx2vfd_path in dmx2vfd_image_paths:
-                try:
-                    if search_region:
-                        found_locs = list(pyautogui.locateAllOnScreen(dmx2vfd_path, confidence=locate_confidence, region=search_region))
-                    else:
-                        found_locs = list(pyautogui.locateAllOnScreen(dmx2vfd_path, confidence=locate_confidence))
-                    if found_locs:
-                        current_iteration_dmx2vfd_locs.extend(found_locs)
-                except pyautogui.ImageNotFoundException:
-                    logger.debug(f"Hình ảnh DMX2VFD '{os.path.basename(dmx2vfd_path)}' không tìm thấy, đang thử tiếp nếu có sẵn.")
-                    pass
-                except Exception as e:
-                    logger.error(f"Lỗi khi xác định vị trí hình ảnh DMX2VFD '{os.path.basename(dmx2vfd_path)}': {e}", exc_info=True)
-                    pass
+        try:
+            found = self._wait_for_match(locate_devices, search_region, timeout)
+        except Exception as e:
+            logger.error(f"Lỗi khi xác định vị trí thiết bị: {e}", exc_info=True)
+            found = None
 
-            if current_iteration_led_locs or current_iteration_pump_locs or current_iteration_dmx2vfd_locs:
-                led_locs = dedupe_and_sort(current_iteration_led_locs)
-                pump_locs = dedupe_and_sort(current_iteration_pump_locs)
-                dmx2vfd_locs = dedupe_and_sort(current_iteration_dmx2vfd_locs)
-                logger.info(f"Tìm thấy {len(led_locs)} LED(s) , {len(pump_locs)} PUMP(s) và {len(dmx2vfd_locs)} DMX2VFD(s) trong Device Discovery.")
-                return led_locs, pump_locs, dmx2vfd_locs
+        if found:
+            led_locs, pump_locs, dmx2vfd_locs = [found[key] for key in device_keys]
+            logger.info(f"Tìm thấy {len(led_locs)} LED(s) , {len(pump_locs)} PUMP(s) và {len(dmx2vfd_locs)} DMX2VFD(s) trong Device Discovery.")
+            return led_locs, pump_locs, dmx2vfd_locs
 
-            time.sleep(0.5)
-                
         logger.warning("Không tìm thấy thiết bị LED, PUMP và DMX2VFD trong Device Discovery trong thời gian chờ.")
         return [], [], []
 
+    @traced
     def chon_thiet_bi(self, device_type_name, device_location):
-        logger.info(f"Đang xử lý {device_type_name} tại {pyautogui.center(device_location)}")
-        center = pyautogui.center(device_location)
-        pyautogui.doubleClick(center.x, center.y, interval=0.1)
-        time.sleep(self.action_delay)
+        center = box_center(device_location)
+        logger.info(f"Đang xử lý {device_type_name} tại {center}")
+        self.backend.double_click(center.x, center.y)
+        self._sleep(self.action_delay)
         
+    @traced
     def chon_thiet_bi_va_ghi(self, device_type_name, device_location, address):
-        logger.info(f"Đang xử lý {device_type_name} tại {pyautogui.center(device_location)} với địa chỉ {address}")
-        center = pyautogui.center(device_location)
-        pyautogui.doubleClick(center.x, center.y, interval=0.1)
-        time.sleep(self.action_delay)
-        time.sleep(1) 
+        center = box_center(device_location)
+        logger.info(f"Đang xử lý {device_type_name} tại {center} với địa chỉ {address}")
+        baseline = self.screen_signature(self._resolve_search_region())
+        self.backend.double_click(center.x, center.y)
+        self._sleep(self.action_delay)
+        self.wait_until_changed(timeout=1, since=baseline)
         if not self.type_text(address, image_name_key='dmx_slave_address_field', select_all_first=True, timeout=10):
             return f"Thất bại: Không thể gõ Địa chỉ cho {device_type_name}."
         if self.find_and_click('set_dmx_slave_address_btn', timeout=3):
@@ -413,21 +2031,21 @@ class ACSAutomation:
             return f"Thất bại: Không thể ghi Địa chỉ cho {device_type_name}."
         return f"Ghi địa chỉ {device_type_name} thành công."
 
-    def find(self, image_name_key, timeout=30, confidence_override=None):
-        return self.wait_for_image(image_name_key, timeout, confidence_override)
+    def find(self, image_name_key, timeout=30, confidence_override=None, region=None):
+        return self.wait_for_image(image_name_key, timeout, confidence_override, region)
 
+    @traced(key_arg='slider_image_key')
     def drag_slider(self, slider_image_key, offset_x, offset_y, duration=1):
         image_paths = self._get_image_paths_list(slider_image_key)
         if not image_paths:
             return False
         logger.info(f"Đang kéo thanh trượt '{slider_image_key}'...")
         try:
-            location = self.locate_image(image_paths, confidence_override=0.8, timeout=10)
+            location = self.locate_image(image_paths, confidence_override=0.8, timeout=10, region=self._resolve_search_region(slider_image_key))
             if location:
-                center = pyautogui.center(location)
-                pyautogui.moveTo(center.x, center.y, duration=0.2)
-                pyautogui.dragRel(offset_x, offset_y, duration=duration, button='left')
-                time.sleep(self.action_delay)
+                center = box_center(location)
+                self.backend.drag(center.x, center.y, offset_x, offset_y, duration=duration)
+                self._sleep(self.action_delay)
                 return True
             else:
                 logger.error(f"Không tìm thấy thanh trượt '{slider_image_key}'.")
@@ -439,25 +2057,27 @@ class ACSAutomation:
     def is_slider_already_moved(self, slider_moved_image_key, timeout=5, confidence_override=None):
         return self.wait_for_image(slider_moved_image_key, timeout, confidence_override)
 
-    def locate_image(self, image_paths, confidence_override=None, timeout=30):
+    @traced
+    def locate_image(self, image_paths, confidence_override=None, timeout=30, region=None):
         current_confidence = confidence_override if confidence_override is not None else self.confidence
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            for image_path in image_paths:
-                try:
-                    time.sleep(self.screenshot_delay)
-                    location = pyautogui.locateOnScreen(image_path, confidence=current_confidence)
-                    if location:
-                        return location
-                except pyautogui.ImageNotFoundException:
-                    pass
-                except Exception as e:
-                    logger.error(f"Lỗi khi tìm hình ảnh {os.path.basename(image_path)}: {e}")
-                    return None
-            time.sleep(0.5)
+        templates = self.templates.get_paths(image_paths)
+        if not templates:
+            return None
+        search_region = region or self._resolve_search_region()
+        offset = (search_region[0], search_region[1]) if search_region else (0, 0)
+        try:
+            match = self._wait_for_match(
+                lambda frame: self._locate_in_frame(frame, templates, current_confidence, offset)[0],
+                search_region, timeout)
+            if match:
+                return match
+        except Exception as e:
+            logger.error(f"Lỗi khi tìm hình ảnh {', '.join(os.path.basename(p) for p in image_paths)}: {e}")
+            return None
         logger.warning(f"Không tìm thấy hình ảnh sau {timeout} giây.")
         return None
 
+    @traced
     def _select_device_type(self, device_type):
         logger.info(f"Đang chọn thiết bị: {device_type}")
         if not self.find_and_click('device_type_field', timeout=10):
@@ -478,6 +2098,7 @@ class ACSAutomation:
             return f"Thất bại: Invalid device type: {device_type}"
         return f"Device type selected: {device_type}"
     
+    @traced
     def _select_device_power(self, device_power):
         logger.info(f"Đang chọn công suất: {device_power}")
         if not self.find_and_click('device_power_field', timeout=10):
@@ -497,6 +2118,7 @@ class ACSAutomation:
         return f"Device power selected: {device_power}"
 
 acs_auto = ACSAutomation()
+startup.mark("Tự động hóa")
 
 class AutoACSTool(ctk.CTk):
     def __init__(self):
@@ -514,12 +2136,14 @@ class AutoACSTool(ctk.CTk):
         keyboard.add_hotkey('f3', lambda: self.execute_category_script("address", self.get_excel_context))
         keyboard.add_hotkey('f4', lambda: self.execute_category_script("test", self.get_excel_context))
         keyboard.add_hotkey('f5', lambda: self.execute_category_script("address_test", self.get_excel_context))
+        keyboard.add_hotkey('f6', self.toggle_batch)
         keyboard.add_hotkey('f7', lambda: self.click_acs_device_configuration(520, 220))
         keyboard.add_hotkey('f8', lambda: self.click_acs_device_configuration(560, 220))
         keyboard.add_hotkey('f9', lambda: self.click_acs_device_configuration(610, 220))
         keyboard.add_hotkey('f10', lambda: self.click_acs_device_configuration(650, 220))
 
         self.overrideredirect(True) 
+        self.animations = AnimationScheduler(self)
         self.create_custom_title_bar()
         self.configure(fg_color=DARK_BG)
 
@@ -533,6 +2157,13 @@ class AutoACSTool(ctk.CTk):
         self.tabview.add("Cài đặt")
         self.tabview.add("Suki UwU")
 
+        self.run_report_var = ctk.StringVar(value="")
+        self.queue_status_var = ctk.StringVar(value="")
+        self.batch_runner = BatchRunner()
+        self.pipeline_runner = PipelineRunner()
+        self.worker = AutomationWorker(config_manager.settings.max_pending_jobs)
+        self.worker.on_change = lambda: self.after(0, self.update_queue_status)
+
         self.create_acs_device_manager_tab()
         self.create_acs_device_configuration_tab()
         self.create_settings_tab()
@@ -540,15 +2171,43 @@ class AutoACSTool(ctk.CTk):
 
         logger.info("Sẵn sàng hoạt động.")
         self.update_excel_status()
+        startup.mark("Giao diện")
+        self.after_idle(self._on_first_paint)
+
+    def _on_first_paint(self):
+        self.update_idletasks()
+        startup.mark("Hiển thị")
+        logger.info(startup.summary())
+        budget = config_manager.settings.startup_budget_sec
+        if startup.elapsed() > budget:
+            logger.warning(f"Khởi động mất {startup.elapsed():.2f}s, vượt ngân sách {budget:.2f}s.")
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        errors = acs_auto.warm_up()
+        if errors:
+            self.after(0, lambda: self.abort_startup(errors))
+            return
+        video_paths = [os.path.join(acs_auto.image_folder, f) for f in self.player_manager.idle_files + ["Working.mp4"]]
+        self.player_manager.preload(video_paths)
+        for player in (self.player_manager, self.player_config):
+            if not player.is_playing:
+                self.after(0, player.start_idle)
+        if config_manager.settings.prelaunch_tools:
+            acs_auto.windows.prelaunch()
+
+    def abort_startup(self, errors):
+        details = "\n".join(f"- {name}: {e}" for name, e in errors.items())
+        messagebox.showerror("Lỗi", f"Không tải được thư viện:\n{details}\n\nKiểm tra lại cài đặt Python. Để chạy thử trên màn hình mô phỏng, đặt backend = simulator trong config.ini.")
+        self.destroy()
 
     def click_acs_device_configuration(self, x, y):
-        target_title = "ACS Device Configuration - Version 1.5.0"
+        target_title = acs_auto.windows.title('device_configuration')
         try:
-            windows = pyautogui.getWindowsWithTitle(target_title)
-            if not windows:
+            window = acs_auto.windows.find('device_configuration')
+            if window is None:
                 logger.warning(f"Không tìm thấy cửa sổ: '{target_title}'")
                 return
-            window = windows[0]
             if window.isMinimized:
                 window.restore()
             abs_x = window.left + x
@@ -558,7 +2217,7 @@ class AutoACSTool(ctk.CTk):
             except Exception:
                 pass
             logger.info(f"Đang click tại ({x}, {y}) trên cửa sổ ACS...")
-            pyautogui.click(abs_x, abs_y)
+            acs_auto.backend.click(abs_x, abs_y)
         except Exception as e:
             logger.error(f"Lỗi khi click tọa độ F7-F10: {e}")
     
@@ -597,25 +2256,126 @@ class AutoACSTool(ctk.CTk):
             return "address_test"
         return None
 
-    def _start_followup_if_idle(self, category, retry_count=0):
-        if hasattr(self, 'automation_thread') and self.automation_thread.is_alive():
-            if retry_count < 20:
-                self.after(200, lambda: self._start_followup_if_idle(category, retry_count + 1))
+    def execute_pipeline(self):
+        pipeline = pipeline_manager.get(self.pipeline_var.get())
+        if not pipeline or not pipeline.get('stages'):
+            messagebox.showinfo("Thông báo", "Chưa chọn chuỗi kịch bản hợp lệ trong pipelines.json.")
             return
-        self.execute_category_script(category, self.get_excel_context)
+        context_funcs = {}
+        for category in {stage['category'] for stage in pipeline['stages']}:
+            if category == "uid_col1":
+                snapshot = self.get_uid_col1_context()
+            elif category == "uid_col2":
+                snapshot = self.get_uid_col2_context()
+            else:
+                if self.get_excel_context() is None:
+                    return
+                context_funcs[category] = self.get_excel_context
+                continue
+            context_funcs[category] = lambda snapshot=snapshot: dict(snapshot)
+
+        job = Job(f"Chuỗi: {pipeline['name']}", functools.partial(self._run_pipeline, pipeline, context_funcs))
+        if not self.worker.submit(job):
+            logger.warning(f"Hàng đợi đã đầy ({self.worker.max_pending} lệnh). Vui lòng đợi.")
+            return
+        if self.worker.pending():
+            logger.info(f"📥 Đã xếp hàng chuỗi: {pipeline['name']}")
 
-    def execute_category_script(self, category, context_func=None):
-        if hasattr(self, 'automation_thread') and self.automation_thread.is_alive():
-            logger.warning("Một tác vụ đang chạy. Vui lòng đợi.")
+    def _run_pipeline(self, pipeline, context_funcs):
+        try:
+            report = self.pipeline_runner.run(pipeline, context_funcs)
+            self.after(0, lambda: self.run_report_var.set(f"⛓ {self.pipeline_runner.summary(report)}"))
+        finally:
+            self.after(0, self.update_excel_status)
+            self.after(0, lambda: self.update_entry_fields(acs_auto.current_excel_row_index))
+
+    def _enqueue_followup(self, category):
+        active_script = script_manager.get_active_script(category)
+        if not active_script or acs_auto.stop_requested:
+            return
+        extra_context = self.get_excel_context()
+        if extra_context is None:
+            return
+        self.worker.submit(self._make_job(active_script, category, extra_context, self.get_excel_context), front=True)
+        logger.info(f"📥 Chạy tiếp: {active_script['name']}")
+
+    def update_queue_status(self):
+        current, pending = self.worker.current, self.worker.pending()
+        if current:
+            self.queue_status_var.set(f"▶ {current.name}" + (f" · {len(pending)} lệnh đang chờ" if pending else ""))
+            if self.player_manager.current_mode != "active":
+                suki_path = os.path.join(acs_auto.image_folder, "Working.mp4")
+                self.player_manager.start_active(suki_path)
+                self.player_config.start_active(suki_path)
+        elif pending:
+            self.queue_status_var.set(f"{len(pending)} lệnh đang chờ")
+        else:
+            self.queue_status_var.set("")
+            if self.player_manager.current_mode == "active":
+                self.player_manager.start_idle()
+                self.player_config.start_idle()
+
+    def toggle_batch(self):
+        if self.batch_runner.running:
+            self.batch_runner.cancel()
+            return
+        if self.worker.discard('batch'):
+            logger.info("🗑 Đã hủy batch đang chờ.")
             return
 
+        category = BATCH_CATEGORIES[self.batch_category_var.get()]
         active_script = script_manager.get_active_script(category)
         if not active_script:
             messagebox.showinfo("Thông báo", f"Chưa có kịch bản nào được chọn (Active) cho '{category}'. Hãy bấm nút 📄 để chọn.")
             return
+        self.offer_batch_resume()
+        if self.get_excel_context() is None:
+            return
 
-        steps = active_script['steps']
-        script_name = active_script['name']
+        job = Job(f"Batch: {active_script['name']}", functools.partial(self._run_batch, active_script['steps'], category, active_script['name']), 'batch')
+        if not self.worker.submit(job):
+            logger.warning(f"Hàng đợi đã đầy ({self.worker.max_pending} lệnh). Vui lòng đợi.")
+            return
+        if self.worker.pending():
+            logger.info(f"📥 Đã xếp hàng batch: {active_script['name']}")
+
+    def offer_batch_resume(self):
+        if not acs_auto.excel_data:
+            return
+        total_rows = len(acs_auto.excel_data)
+        next_row = acs_auto.batch_checkpoint.get_next_row(acs_auto.excel_file_path, total_rows)
+        if not next_row or next_row == acs_auto.current_excel_row_index:
+            return
+        if messagebox.askyesno("Tiếp tục batch", f"Batch trước đã ghi xong đến hàng {next_row}/{total_rows}. Tiếp tục từ hàng {next_row + 1}?"):
+            acs_auto.current_excel_row_index = next_row
+            logger.info(f"Tiếp tục từ checkpoint: hàng {next_row + 1}/{total_rows}")
+        else:
+            acs_auto.batch_checkpoint.clear(acs_auto.excel_file_path)
+        self.update_excel_status()
+        self.update_entry_fields(acs_auto.current_excel_row_index)
+
+    def _run_batch(self, steps, category, script_name):
+        logger.info(f"🚀 Chạy batch: {script_name} từ hàng {acs_auto.current_excel_row_index + 1}/{len(acs_auto.excel_data)}")
+        self.after(0, lambda: self.set_buttons_state("disabled"))
+        self.after(0, lambda: self.btn_batch.configure(text="Hủy batch (F6)"))
+        try:
+            self.batch_runner.run(steps, category, script_name, self.get_excel_context,
+                                  lambda batch: self.after(0, lambda: self.update_batch_status(batch)))
+        finally:
+            self.after(0, lambda: self.set_buttons_state("normal"))
+            self.after(0, lambda: self.btn_batch.configure(text="Chạy hết danh sách (F6)"))
+
+    def update_batch_status(self, batch):
+        state = "Tạm dừng (ESC để tiếp tục)" if batch.paused else ("Đang chạy" if batch.running else "Xong")
+        self.batch_status_var.set(f"Batch: {state} · {batch.rows_done} hàng · {batch.rows_per_hour():.0f} hàng/giờ")
+        self.update_excel_status()
+        self.update_entry_fields(acs_auto.current_excel_row_index)
+
+    def execute_category_script(self, category, context_func=None):
+        active_script = script_manager.get_active_script(category)
+        if not active_script:
+            messagebox.showinfo("Thông báo", f"Chưa có kịch bản nào được chọn (Active) cho '{category}'. Hãy bấm nút 📄 để chọn.")
+            return
 
         extra_context = {}
         if context_func:
@@ -623,71 +2383,34 @@ class AutoACSTool(ctk.CTk):
             if extra_context is None:
                 return
 
-        logger.info(f"🚀 Đang chạy kịch bản: {script_name}")
-        self.set_buttons_state("disabled")
-        self._current_running_category = category
-
-        suki_path = os.path.join(acs_auto.image_folder, "Working.mp4")
-        self.player_manager.start_active(suki_path)
-        self.player_config.start_active(suki_path)
+        if not self.worker.submit(self._make_job(active_script, category, extra_context, context_func)):
+            logger.warning(f"Hàng đợi đã đầy ({self.worker.max_pending} lệnh). Vui lòng đợi.")
+            return
+        if self.worker.pending():
+            logger.info(f"📥 Đã xếp hàng: {active_script['name']} ({len(self.worker.pending())} lệnh đang chờ)")
 
-        self.automation_thread = threading.Thread(
-            target=self._run_dynamic_script, 
-            args=(steps, extra_context)
-        )
-        self.automation_thread.start()
+    def _make_job(self, active_script, category, extra_context, context_func=None):
+        refresh_context = context_func if 'current_row_index' in extra_context else None
+        return Job(active_script['name'], functools.partial(self._run_dynamic_script, active_script['steps'], extra_context,
+                                                           category, active_script['name'], refresh_context))
 
-    def _run_dynamic_script(self, steps, extra_context):
-        results = []
+    def _run_dynamic_script(self, steps, extra_context, category=None, script_name=None, refresh_context=None):
+        if refresh_context:
+            extra_context = refresh_context()
+            if extra_context is None:
+                return
+        logger.info(f"🚀 Đang chạy kịch bản: {script_name}")
         try:
-            context = {
-                'acs_auto': acs_auto,
-                'logger': logger,
-                'time': time,
-                'pyautogui': pyautogui,
-                'results': results,
-                'script_stop': False, 
-                **extra_context
-            }
-
-            for i, step in enumerate(steps):
-                if acs_auto.stop_requested:
-                    logger.warning("🛑 Đã dừng kịch bản.")
-                    results.append("Đã dừng bởi người dùng.")
-                    break
-                if context.get('script_stop', False):
-                    logger.info("⏹ Kịch bản dừng lại do lệnh 'script_stop = True'.")
-                    break
-
-                step_name = step.get('name', f'Step {i+1}')
-                code_str = step.get('code', 'pass')
-
-                logger.info(f"▶ Step: {step_name}")
-                try:
-                    exec(code_str, globals(), context)
-                    if context.get('script_stop', False):
-                        continue 
-                except Exception as e:
-                    err_msg = f"❌ Lỗi '{step_name}': {e}"
-                    logger.error(err_msg)
-                    results.append(err_msg)
-
-            final_msg = " | ".join([str(r) for r in results])
-            if final_msg:
-                logger.info(f"Kết quả: {final_msg}")
-
-        except Exception as e:
-            logger.error(f"Lỗi hệ thống script: {e}", exc_info=True)
+            results, report = run_script(steps, extra_context, category, script_name)
+            if report:
+                self.after(0, lambda: self.show_run_summary(report))
         finally:
-            self.after(0, self.player_manager.start_idle)
-            self.after(0, self.player_config.start_idle)
-            self.after(0, lambda: self.set_buttons_state("normal"))
             self.after(0, self.update_excel_status)
             self.after(0, lambda: self.update_entry_fields(acs_auto.current_excel_row_index))
 
             followup = self.get_followup_category()
-            if followup and self._current_running_category in ("uid_col1", "uid_col2"):
-                self.after(200, lambda cat=followup: self._start_followup_if_idle(cat))
+            if followup and category in ("uid_col1", "uid_col2"):
+                self._enqueue_followup(followup)
 
     def create_acs_device_manager_tab(self):
         tab = self.tabview.tab("ACS Device Manager")
@@ -792,12 +2515,36 @@ class AutoACSTool(ctk.CTk):
             font=(MAIN_FONT, 12, "bold")
         ).pack(anchor="w", padx=5)
 
+        pipeline_frame = ctk.CTkFrame(followup_frame, fg_color="transparent")
+        pipeline_frame.pack(fill="x", padx=5, pady=(5, 0))
+        pipeline_names = pipeline_manager.names()
+        self.pipeline_var = ctk.StringVar(value=pipeline_names[0] if pipeline_names else "")
+        ctk.CTkComboBox(pipeline_frame, variable=self.pipeline_var, values=pipeline_names, state="readonly", font=(MAIN_FONT, 12), dropdown_font=(MAIN_FONT, 12)).pack(side="left", fill="x", expand=True)
+        ctk.CTkButton(pipeline_frame, text="Chạy chuỗi", width=100, fg_color=BUTTON_BG, hover_color=HOVER_COLOR, font=(MAIN_FONT, 14, "bold"),
+            command=self.execute_pipeline).pack(side="left", padx=(5, 0))
+
+        self.create_run_report_label(followup_frame)
+
         self.update_device_power_options_col(1)
         self.update_device_power_options_col(2)
         
         video_path = os.path.join(acs_auto.image_folder, "Working.mp4")
-        self.player_manager = VideoPlayer(tab, acs_auto.image_folder)
-        self.player_manager.start_idle()
+        self.player_manager = VideoPlayer(tab, acs_auto.image_folder, self.animations)
+
+    def create_run_report_label(self, parent):
+        ctk.CTkLabel(parent, textvariable=self.queue_status_var, text_color=ACCENT_COLOR, font=(MAIN_FONT, 11)).pack(anchor="w", padx=5, pady=(5, 0))
+        lbl = ctk.CTkLabel(parent, textvariable=self.run_report_var, text_color="gray", cursor="hand2", font=(MAIN_FONT, 11))
+        lbl.pack(anchor="w", padx=5)
+        lbl.bind("<Button-1>", lambda e: self.open_run_report())
+        return lbl
+
+    def show_run_summary(self, report):
+        totals = report['totals']
+        self.run_report_var.set(f"⏱ {report['wall']:.1f}s · chụp {totals['capture']:.1f}s · khớp {totals['match']:.1f}s · chờ {totals['sleep']:.1f}s · lặp {totals['retries']} (bấm để xem)")
+
+    def open_run_report(self):
+        if acs_auto.profiler.last_report:
+            RunReportWindow(self, acs_auto.profiler.last_report)
 
     def update_device_power_options_col(self, col):
         if col == 1:
@@ -847,6 +2594,16 @@ class AutoACSTool(ctk.CTk):
         self.btn_test = create_config_btn_row(tab, "Test (F4)", "test", self.get_excel_context)
         self.btn_ghi_dia_chi_test = create_config_btn_row(tab, "Ghi địa chỉ & Test (F5)", "address_test", self.get_excel_context)
 
+        batch_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        batch_frame.pack(pady=5, fill="x", padx=10)
+        self.btn_batch = ctk.CTkButton(batch_frame, text="Chạy hết danh sách (F6)", fg_color=BUTTON_BG, hover_color=HOVER_COLOR, font=(MAIN_FONT, 14, "bold"),
+            command=self.toggle_batch)
+        self.btn_batch.pack(side="left", fill="x", expand=True)
+        self.batch_category_var = ctk.StringVar(value=list(BATCH_CATEGORIES)[0])
+        ctk.CTkComboBox(batch_frame, variable=self.batch_category_var, values=list(BATCH_CATEGORIES), width=150, state="readonly", font=(MAIN_FONT, 12), dropdown_font=(MAIN_FONT, 12)).pack(side="left", padx=(5, 0))
+        self.batch_status_var = ctk.StringVar(value="")
+        ctk.CTkLabel(tab, textvariable=self.batch_status_var, text_color="gray", font=(MAIN_FONT, 11)).pack(anchor="w", padx=15)
+
         ctk.CTkProgressBar(tab, height=2, progress_color=ACCENT_COLOR).pack(fill="x", pady=10, padx=20)
 
         excel_frame = ctk.CTkFrame(tab)
@@ -884,11 +2641,12 @@ class AutoACSTool(ctk.CTk):
 
         chk_auto_inc = ctk.CTkCheckBox(excel_frame, text="Tự động xuống hàng", variable=self.auto_inc_var, command=on_auto_inc_toggle, fg_color=ACCENT_COLOR, hover_color=HOVER_COLOR, font=(MAIN_FONT, 12, "bold"))
         chk_auto_inc.pack(pady=(10, 10), anchor="w", padx=20)
+
+        self.create_run_report_label(tab)
         
         acs_auto.enable_auto_increment = True
         video_path = os.path.join(acs_auto.image_folder, "Working.mp4")
-        self.player_config = VideoPlayer(tab, acs_auto.image_folder)
-        self.player_config.start_idle()
+        self.player_config = VideoPlayer(tab, acs_auto.image_folder, self.animations)
 
     def create_settings_tab(self):
         tab = self.tabview.tab("Cài đặt")
@@ -935,11 +2693,12 @@ class AutoACSTool(ctk.CTk):
             entry = ctk.CTkEntry(f, font=(MAIN_FONT, 12))
             entry.pack(side="left", fill="x", expand=True)
             entry.insert(0, default_val)
+            entry.bind("<Return>", lambda e: self.save_settings_dynamic())
             setattr(self, attr_name, entry)
 
         add_gen_entry(gen_frame, "Delay chụp màn hình", "screenshot_delay_entry", config_manager.get('GENERAL', 'screenshot_delay_sec'))
         add_gen_entry(gen_frame, "Delay thao tác", "action_delay_entry", config_manager.get('GENERAL', 'action_delay_sec'))
-        add_gen_entry(gen_frame, "Độ chính xác (0.0 - 1.0)", "confidence_entry", config_manager.get('GENERAL', 'find_image_confidence'))
+        add_gen_entry(gen_frame, "Độ chính xác (0.1 - 1.0)", "confidence_entry", config_manager.get('GENERAL', 'find_image_confidence'))
 
         ctk.CTkProgressBar(right_frame, height=2, progress_color=ACCENT_COLOR).pack(fill="x", pady=10, padx=10)
 
@@ -956,6 +2715,9 @@ class AutoACSTool(ctk.CTk):
         img_scroll.pack(side="right", fill="y")
         self.images_listbox.config(yscrollcommand=img_scroll.set)
 
+        self.lbl_image_stats = ctk.CTkLabel(right_frame, text="", justify="left", anchor="w", text_color="#aaaaaa", font=(MAIN_FONT, 10))
+        self.lbl_image_stats.pack(fill="x", padx=10)
+
         btn_img_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
         btn_img_frame.pack(fill="x", pady=5, padx=5)
 
@@ -987,6 +2749,21 @@ class AutoACSTool(ctk.CTk):
             paths = [p.strip() for p in raw_val.split(',') if p.strip()]
         for p in paths:
             self.images_listbox.insert(tk.END, p)
+        self.refresh_image_stats(key)
+
+    def refresh_image_stats(self, key):
+        stats = acs_auto.match_history.get_variant_stats(key)
+        lines = []
+        for image_name in self.images_listbox.get(0, tk.END):
+            stat = stats.get(image_name)
+            if not stat:
+                lines.append(f"{image_name}: chưa có dữ liệu")
+                continue
+            line = f"{image_name}: {stat['hits']} lần khớp · {stat['rate'] * 100:.0f}% gần đây · độ tin cậy {stat['confidence']:.2f}"
+            if acs_auto.variant_stale_runs and stat['runs_since_hit'] >= acs_auto.variant_stale_runs:
+                line += f" · bỏ qua ({stat['runs_since_hit']} lượt không khớp)"
+            lines.append(line)
+        self.lbl_image_stats.configure(text="\n".join(lines))
 
     def _spawn_inline_entry(self, listbox, index, initial_text, on_commit):
         bbox = listbox.bbox(index)
@@ -1053,7 +2830,7 @@ class AutoACSTool(ctk.CTk):
                 return
 
             val = config_manager.get('IMAGE_PATHS', old_key)
-            config_manager.config.remove_option('IMAGE_PATHS', old_key)
+            config_manager.remove_option('IMAGE_PATHS', old_key)
             config_manager.set('IMAGE_PATHS', final_name, val)
             
             self.refresh_keys_list()
@@ -1070,8 +2847,7 @@ class AutoACSTool(ctk.CTk):
         if not selection: return
         key = self.keys_listbox.get(selection[0])
         if messagebox.askyesno("Xác nhận", f"Bạn có chắc muốn xóa Key '{key}' không?"):
-            config_manager.config.remove_option('IMAGE_PATHS', key)
-            config_manager.save_config() 
+            config_manager.remove_option('IMAGE_PATHS', key)
             self.refresh_keys_list()
             self.images_listbox.delete(0, tk.END)
             self.lbl_current_key.configure(text="Đang chọn: (Chưa chọn)")
@@ -1119,16 +2895,31 @@ class AutoACSTool(ctk.CTk):
         images = self.images_listbox.get(0, tk.END)
         val_str = ",".join(images)
         config_manager.set('IMAGE_PATHS', key, val_str)
+        self.refresh_image_stats(key)
 
     def save_settings_dynamic(self):
+        fields = [
+            ('screenshot_delay_sec', "Delay chụp màn hình", self.screenshot_delay_entry, 0.0, 10.0),
+            ('action_delay_sec', "Delay thao tác", self.action_delay_entry, 0.0, 10.0),
+            ('find_image_confidence', "Độ chính xác", self.confidence_entry, 0.1, 1.0),
+        ]
+        values = {}
+        for key, label, entry, low, high in fields:
+            try:
+                value = float(entry.get())
+            except ValueError:
+                value = None
+            if value is None or not low <= value <= high:
+                messagebox.showwarning("Lỗi", f"{label} phải là số từ {low} đến {high}.")
+                entry.focus_set()
+                return
+            values[key] = value
         try:
-            config_manager.set('GENERAL', 'screenshot_delay_sec', self.screenshot_delay_entry.get())
-            config_manager.set('GENERAL', 'action_delay_sec', self.action_delay_entry.get())
-            config_manager.set('GENERAL', 'find_image_confidence', self.confidence_entry.get())
-            config_manager.save_config()
+            config_manager.update('GENERAL', values)
             logger.info("Người dùng đã lưu cài đặt mới.")
         except Exception as e:
             logger.error(f"Lỗi khi lưu cài đặt: {e}", exc_info=True)
+            messagebox.showerror("Lỗi", f"Không thể lưu cài đặt: {e}")
 
     def create_suki_tab(self):
         tab = self.tabview.tab("Suki UwU")
@@ -1183,6 +2974,10 @@ class AutoACSTool(ctk.CTk):
         if acs_auto.stop_requested == False:
             acs_auto.stop_requested = True
             logger.info("🛑 Đã dừng.")
+            if not self.batch_runner.running:
+                dropped = self.worker.clear()
+                if dropped:
+                    logger.info(f"🗑 Đã hủy {dropped} lệnh đang chờ.")
         else:
             acs_auto.stop_requested = False
             logger.info("▶ Hủy dừng.")
@@ -1198,13 +2993,13 @@ class AutoACSTool(ctk.CTk):
                 row_number = int(self.no_entry.get()) - 1 if self.no_entry.get() else None
             elif trigger == "pump":
                 pump_value = int(self.pump_entry.get()) if self.pump_entry.get() else None
-                row_number = next((i for i, row in enumerate(acs_auto.excel_data) if row['Pump'] == pump_value), None) if pump_value else None
+                row_number = acs_auto.excel_data.find_row('Pump', pump_value) if pump_value and acs_auto.excel_data else None
             elif trigger == "led":
                 led_value = int(self.led_entry.get()) if self.led_entry.get() else None
-                row_number = next((i for i, row in enumerate(acs_auto.excel_data) if row['Led'] == led_value), None) if led_value else None
+                row_number = acs_auto.excel_data.find_row('Led', led_value) if led_value and acs_auto.excel_data else None
             elif trigger == "dmx2vfd":
                 dmx2vfd_value = int(self.dmx2vfd_entry.get()) if self.dmx2vfd_entry.get() else None
-                row_number = next((i for i, row in enumerate(acs_auto.excel_data) if row['Dmx2Vfd'] == dmx2vfd_value), None) if dmx2vfd_value else None
+                row_number = acs_auto.excel_data.find_row('Dmx2Vfd', dmx2vfd_value) if dmx2vfd_value and acs_auto.excel_data else None
             else:
                 return
             
@@ -1251,7 +3046,7 @@ class AutoACSTool(ctk.CTk):
             if acs_auto.import_excel_data(file_path):
                 logger.info("Nhập Excel thành công!")
                 self.update_excel_status()
-                self.update_entry_fields(0)
+                self.update_entry_fields(acs_auto.current_excel_row_index)
             else:
                 logger.error("Không thể nhập file Excel. Vui lòng kiểm tra log.")
                 self.update_excel_status()
@@ -1276,23 +3071,9 @@ class AutoACSTool(ctk.CTk):
                 ctk.CTkLabel(self.title_bar, image=self.title_icon_img, text="").pack(side="left", padx=5, pady=2)
             except: pass
         
-        def animate_title_rainbow(parent, text="A C S  A u t o", font=(MAIN_FONT, 11, "bold"), bg="#2b2b2b", speed=50):
-            canvas = tk.Canvas(parent, bg=bg, highlightthickness=0, height=28)
-            canvas.pack(side="left", fill="x", expand=True)
-            hue = 0.0
-            def draw_text():
-                nonlocal hue
-                canvas.delete("all")
-                for i, ch in enumerate(reversed(text)):
-                    offset = (hue + i * 0.01) % 1.0
-                    r, g, b = [int(255 * v) for v in colorsys.hsv_to_rgb(offset, 1, 1)]
-                    canvas.create_text(175 + (len(text) - i - 1) * 5, 15, text=ch, fill=f'#{r:02x}{g:02x}{b:02x}', font=font, anchor="w")
-                hue = (hue + 0.02) % 1.0
-                canvas.after(speed, draw_text)
-            draw_text()
-            return canvas
-
-        canvas = animate_title_rainbow(self.title_bar, bg=FRAME_BG)
+        canvas = tk.Canvas(self.title_bar, bg=FRAME_BG, highlightthickness=0, height=28)
+        canvas.pack(side="left", fill="x", expand=True)
+        self.animate_rainbow_text(canvas, "A C S  A u t o", 175, 15)
 
         self.close_button = ctk.CTkButton(self.title_bar, text="❌", command=self.destroy,
             fg_color="transparent", hover_color="#cc3333", width=30, height=30, font=(MAIN_FONT, 12))
@@ -1306,6 +3087,17 @@ class AutoACSTool(ctk.CTk):
         canvas.bind("<ButtonPress-1>", self._start_move_window)
         canvas.bind("<B1-Motion>", self._move_window)
 
+    def animate_rainbow_text(self, canvas, text, x, y, font=(MAIN_FONT, 11, "bold"), speed=50):
+        items = [canvas.create_text(x + (len(text) - i - 1) * 5, y, text=ch, font=font, anchor="w") for i, ch in enumerate(reversed(text))]
+        phase = 0
+        def step():
+            nonlocal phase
+            for i, item in enumerate(items):
+                canvas.itemconfigure(item, fill=RAINBOW_PALETTE[(phase + i) % len(RAINBOW_PALETTE)])
+            phase = (phase + 2) % len(RAINBOW_PALETTE)
+            return speed
+        return self.animations.register(canvas, step)
+
     def minimize_window(self):
         self.withdraw()
         self.show_mini_bar()
@@ -1328,24 +3120,9 @@ class AutoACSTool(ctk.CTk):
         self.mini_bar.geometry(f"{width}x{height}+{x}+{y}")
         self.mini_bar.attributes("-alpha", 0.92)
 
-        def create_rainbow_canvas(parent, text="A C S  A u t o  :3", font=(MAIN_FONT, 11, "bold"), bg="#2b2b2b", speed=50):
-            canvas = tk.Canvas(parent, bg=bg, highlightthickness=0)
-            canvas.pack(expand=True, fill="both")
-            hue = 0.0
-            def draw_text():
-                nonlocal hue
-                canvas.delete("all")
-                for i, ch in enumerate(reversed(text)):
-                    offset = (hue + i * 0.01) % 1.0
-                    r, g, b = [int(255 * v) for v in colorsys.hsv_to_rgb(offset, 1, 1)]
-                    color = f'#{r:02x}{g:02x}{b:02x}'
-                    canvas.create_text(25 + (len(text) - i - 1) * 5, 20, text=ch, fill=color, font=font, anchor="w")
-                hue = (hue + 0.02) % 1.0
-                canvas.after(speed, draw_text)
-            draw_text()
-            return canvas
-
-        canvas = create_rainbow_canvas(self.mini_bar, text="A C S  A u t o  :3")
+        canvas = tk.Canvas(self.mini_bar, bg="#2b2b2b", highlightthickness=0)
+        canvas.pack(expand=True, fill="both")
+        self.animate_rainbow_text(canvas, "A C S  A u t o  :3", 25, 20)
         canvas.bind("<Button-1>", self.start_move)
         canvas.bind("<B1-Motion>", self.do_move)
         canvas.bind("<Double-Button-1>", lambda e: self.restore_main_window())
@@ -1380,6 +3157,8 @@ class ScriptManager:
     def __init__(self, filepath='scripts.json'):
         self.filepath = os.path.join(os.path.dirname(__file__), filepath)
         self.scripts = self.load_scripts()
+        self._compiled = {}
+        self._compile_lock = threading.Lock()
 
     def load_scripts(self):
         if not os.path.exists(self.filepath):
@@ -1404,9 +3183,45 @@ class ScriptManager:
         except Exception as e:
             logger.error(f"Lỗi lưu script json: {e}")
 
+    def _step_filename(self, category, script_name, step_name):
+        return f"<{category}/{script_name}/{step_name}>"
+
+    def compile_step(self, category, script_name, step, step_index=0):
+        code_str = step.get('code', 'pass')
+        filename = self._step_filename(category, script_name, step.get('name', f'Step {step_index + 1}'))
+        cache_key = (filename, hashlib.sha1(code_str.encode('utf-8')).hexdigest())
+        with self._compile_lock:
+            code = self._compiled.get(cache_key)
+            if code is None:
+                code = compile(code_str, filename, 'exec')
+                self._compiled[cache_key] = code
+                linecache.cache[filename] = (len(code_str), None, code_str.splitlines(True), filename)
+        return code
+
+    def validate_steps(self, category, script_name, steps):
+        errors = []
+        for i, step in enumerate(steps):
+            try:
+                compile(step.get('code', 'pass'), self._step_filename(category, script_name, step.get('name', f'Step {i + 1}')), 'exec')
+            except SyntaxError as e:
+                errors.append((i, f"{step.get('name', f'Step {i + 1}')} (dòng {e.lineno}): {e.msg}"))
+        return errors
+
+    def invalidate_compiled(self, category, script_name=None):
+        prefix = f"<{category}/{script_name}/" if script_name is not None else f"<{category}/"
+        with self._compile_lock:
+            for cache_key in [k for k in self._compiled if k[0].startswith(prefix)]:
+                del self._compiled[cache_key]
+                linecache.cache.pop(cache_key[0], None)
+
     def get_scripts_by_category(self, category):
         return self.scripts.get(category, [])
 
+    def get_script(self, category, script_name=None):
+        if script_name is None:
+            return self.get_active_script(category)
+        return next((script for script in self.get_scripts_by_category(category) if script['name'] == script_name), None)
+
     def get_active_script(self, category):
         scripts = self.get_scripts_by_category(category)
         for script in scripts:
@@ -1428,6 +3243,327 @@ class ScriptManager:
         return data
 
 script_manager = ScriptManager()
+startup.mark("Kịch bản")
+
+def run_failed(results):
+    return any(str(r).startswith(("Thất bại", "❌")) for r in results)
+
+def run_script(steps, extra_context, category=None, script_name=None, skip_once=False):
+    results = []
+    report = None
+    profiler = acs_auto.profiler
+    profiler.start_run(category, script_name)
+    acs_auto.recorder.start_run(category, script_name, steps, extra_context)
+    try:
+        if not skip_once:
+            acs_auto.clear_search_window()
+        context = {
+            'acs_auto': acs_auto,
+            'logger': logger,
+            'time': ProfiledTime(profiler, acs_auto.backend.time),
+            'pyautogui': pyautogui,
+            'results': results,
+            'script_stop': False, 
+            **extra_context
+        }
+
+        for i, step in enumerate(steps):
+            if acs_auto.stop_requested:
+                logger.warning("🛑 Đã dừng kịch bản.")
+                results.append("Đã dừng bởi người dùng.")
+                break
+            if context.get('script_stop', False):
+                logger.info("⏹ Kịch bản dừng lại do lệnh 'script_stop = True'.")
+                break
+
+            step_name = step.get('name', f'Step {i+1}')
+            if skip_once and step.get('once', False):
+                logger.info(f"⏭ Bỏ qua bước chạy một lần: {step_name}")
+                continue
+
+            logger.info(f"▶ Step: {step_name}")
+            try:
+                code = script_manager.compile_step(category, script_name, step, i)
+                with profiler.step(step_name):
+                    postconditions = step.get('postconditions')
+                    if postconditions and acs_auto.postconditions_hold(postconditions):
+                        logger.info(f"⏭ Bỏ qua '{step_name}': giao diện đã ở trạng thái cần thiết.")
+                        continue
+                    exec(code, globals(), context)
+                if context.get('script_stop', False):
+                    continue 
+            except Exception as e:
+                err_msg = f"❌ Lỗi '{step_name}': {e}"
+                logger.error(err_msg, exc_info=True)
+                results.append(err_msg)
+
+        final_msg = " | ".join([str(r) for r in results])
+        if final_msg:
+            logger.info(f"Kết quả: {final_msg}")
+
+    except Exception as e:
+        logger.error(f"Lỗi hệ thống script: {e}", exc_info=True)
+    finally:
+        acs_auto.match_history.save_history()
+        report = profiler.finish_run(results)
+        if report:
+            logger.info(f"⏱ Thời gian chạy: {report['wall']:.2f}s (chụp {report['totals']['capture']:.2f}s, khớp {report['totals']['match']:.2f}s, chờ {report['totals']['sleep']:.2f}s)")
+        acs_auto.recorder.finish_run(results, report)
+    return results, report
+
+class BatchRunner:
+    def __init__(self):
+        self.running = False
+        self.paused = False
+        self.cancel_requested = False
+        self.rows_done = 0
+        self.active_seconds = 0.0
+
+    def rows_per_hour(self):
+        if self.active_seconds <= 0:
+            return 0.0
+        return self.rows_done * 3600 / self.active_seconds
+
+    def cancel(self):
+        self.cancel_requested = True
+        acs_auto.stop_requested = True
+
+    def _wait_for_resume(self, on_progress):
+        self.paused = True
+        on_progress(self)
+        logger.info("⏸ Batch tạm dừng. Nhấn ESC để tiếp tục.")
+        while acs_auto.stop_requested and not self.cancel_requested:
+            time.sleep(0.2)
+        self.paused = False
+        on_progress(self)
+        return not self.cancel_requested
+
+    def run(self, steps, category, script_name, context_func, on_progress):
+        self.running = True
+        self.cancel_requested = False
+        self.rows_done = 0
+        self.active_seconds = 0.0
+        previous_auto_increment = acs_auto.enable_auto_increment
+        acs_auto.enable_auto_increment = True
+        setup_done = False
+        try:
+            while not self.cancel_requested and acs_auto.excel_data and acs_auto.current_excel_row_index < len(acs_auto.excel_data):
+                if acs_auto.stop_requested:
+                    if not self._wait_for_resume(on_progress):
+                        break
+                    setup_done = False
+                    continue
+
+                row = acs_auto.current_excel_row_index
+                extra_context = context_func()
+                if extra_context is None:
+                    break
+                logger.info(f"📋 Batch: hàng {row + 1}/{len(acs_auto.excel_data)}")
+                started = time.perf_counter()
+                results, _ = run_script(steps, extra_context, category, script_name, skip_once=setup_done)
+                self.active_seconds += time.perf_counter() - started
+
+                failed = run_failed(results)
+                if acs_auto.current_excel_row_index > row:
+                    self.rows_done += acs_auto.current_excel_row_index - row
+                    setup_done = True
+                    acs_auto.batch_checkpoint.mark_completed(acs_auto.excel_file_path, acs_auto.current_excel_row_index - 1, len(acs_auto.excel_data))
+                if failed and not self.cancel_requested:
+                    logger.warning(f"Hàng {acs_auto.current_excel_row_index + 1} thất bại. Batch tạm dừng, nhấn ESC để chạy lại hàng này.")
+                    acs_auto.stop_requested = True
+                elif acs_auto.current_excel_row_index == row and not self.cancel_requested:
+                    logger.warning(f"Hàng {row + 1} chưa hoàn thành. Batch tạm dừng, nhấn ESC để chạy lại hàng này.")
+                    acs_auto.stop_requested = True
+                on_progress(self)
+            if not self.cancel_requested:
+                logger.info(f"✅ Batch xong {self.rows_done} hàng ({self.rows_per_hour():.0f} hàng/giờ).")
+                if acs_auto.excel_data and acs_auto.current_excel_row_index >= len(acs_auto.excel_data):
+                    acs_auto.batch_checkpoint.clear(acs_auto.excel_file_path)
+        finally:
+            if self.cancel_requested:
+                acs_auto.stop_requested = False
+                logger.info(f"⏹ Đã hủy batch sau {self.rows_done} hàng.")
+            acs_auto.enable_auto_increment = previous_auto_increment
+            self.running = False
+            on_progress(self)
+
+class PipelineManager:
+    def __init__(self, filepath='pipelines.json'):
+        self.filepath = os.path.join(os.path.dirname(__file__), filepath)
+        self.pipelines = self.load_pipelines()
+
+    def load_pipelines(self):
+        if not os.path.exists(self.filepath):
+            self.pipelines = self.create_default_pipelines()
+            self.save_pipelines()
+            return self.pipelines
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi đọc pipelines json: {e}")
+            return self.create_default_pipelines()
+
+    def save_pipelines(self):
+        try:
+            with open(self.filepath, 'w', encoding='utf-8') as f:
+                json.dump(self.pipelines, f, indent=4, ensure_ascii=False)
+            logger.info("Đã lưu chuỗi kịch bản.")
+        except Exception as e:
+            logger.error(f"Lỗi lưu pipelines json: {e}")
+
+    def names(self):
+        return [pipeline['name'] for pipeline in self.pipelines]
+
+    def get(self, name):
+        return next((pipeline for pipeline in self.pipelines if pipeline['name'] == name), None)
+
+    def create_default_pipelines(self):
+        return [
+            {"name": "UID → Ghi địa chỉ", "stages": [{"category": "uid_col1"}, {"category": "address", "retries": 1}]},
+            {"name": "UID → Ghi địa chỉ & Test", "stages": [{"category": "uid_col1"}, {"category": "address_test", "retries": 1}]}
+        ]
+
+pipeline_manager = PipelineManager()
+
+class PipelineRunner:
+    def __init__(self):
+        self.running = False
+        self.last_report = None
+
+    def _stage_enabled(self, condition, context, status):
+        try:
+            return bool(eval(condition, {}, {**context, 'status': status}))
+        except Exception as e:
+            logger.error(f"Lỗi điều kiện '{condition}': {e}")
+            return False
+
+    def run(self, pipeline, context_funcs):
+        self.running = True
+        shared_context = {}
+        status = {}
+        stages = []
+        started = time.perf_counter()
+        logger.info(f"⛓ Bắt đầu chuỗi: {pipeline['name']}")
+        try:
+            for stage in pipeline.get('stages', []):
+                category = stage['category']
+                entry = {'category': category, 'script': None, 'status': 'skipped', 'attempts': 0, 'wall': 0.0}
+                stages.append(entry)
+                if acs_auto.stop_requested:
+                    entry['status'] = 'stopped'
+                    break
+                script = script_manager.get_script(category, stage.get('script'))
+                if not script:
+                    logger.error(f"Không tìm thấy kịch bản cho '{category}'.")
+                    entry['status'] = status[category] = 'failed'
+                    if stage.get('skip_on_failure'):
+                        continue
+                    break
+                entry['script'] = script['name']
+                if stage.get('when') and not self._stage_enabled(stage['when'], shared_context, status):
+                    logger.info(f"⛓ Bỏ qua {script['name']} (điều kiện: {stage['when']})")
+                    status[category] = 'skipped'
+                    continue
+
+                retries = int(stage.get('retries', 0))
+                stage_started = time.perf_counter()
+                succeeded = False
+                for attempt in range(retries + 1):
+                    context_func = context_funcs.get(category)
+                    extra_context = context_func() if context_func else {}
+                    if extra_context is None:
+                        break
+                    shared_context.update(extra_context)
+                    entry['attempts'] += 1
+                    results, report = run_script(script['steps'], dict(shared_context), category, script['name'])
+                    succeeded = not run_failed(results) and not acs_auto.stop_requested
+                    if succeeded or acs_auto.stop_requested:
+                        break
+                    if attempt < retries:
+                        logger.warning(f"⛓ {script['name']} thất bại, thử lại lần {attempt + 1}/{retries}")
+                entry['wall'] = time.perf_counter() - stage_started
+                entry['status'] = status[category] = 'ok' if succeeded else ('stopped' if acs_auto.stop_requested else 'failed')
+                if not succeeded and (acs_auto.stop_requested or not stage.get('skip_on_failure')):
+                    break
+        finally:
+            self.running = False
+            self.last_report = {'pipeline': pipeline['name'], 'wall': time.perf_counter() - started, 'stages': stages}
+            logger.info(f"⛓ {self.summary(self.last_report)}")
+        return self.last_report
+
+    def summary(self, report):
+        marks = {'ok': '✓', 'failed': '✗', 'skipped': '–', 'stopped': '■'}
+        parts = []
+        for stage in report['stages']:
+            part = f"{stage['script'] or stage['category']} {stage['wall']:.1f}s {marks.get(stage['status'], '?')}"
+            if stage['attempts'] > 1:
+                part += f" ({stage['attempts']} lần)"
+            parts.append(part)
+        return f"{report['pipeline']}: {report['wall']:.1f}s · " + " · ".join(parts)
+
+class AutomationWorker:
+    def __init__(self, max_pending=5):
+        self.max_pending = max_pending
+        self.current = None
+        self.on_change = None
+        self._jobs = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, job, front=False):
+        with self._cond:
+            if not front and len(self._jobs) >= self.max_pending:
+                return False
+            if front:
+                self._jobs.appendleft(job)
+            else:
+                self._jobs.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        self._changed()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return [job.name for job in self._jobs]
+
+    def clear(self):
+        with self._cond:
+            dropped = len(self._jobs)
+            self._jobs.clear()
+        self._changed()
+        return dropped
+
+    def discard(self, kind):
+        with self._cond:
+            kept = [job for job in self._jobs if job.kind != kind]
+            dropped = len(self._jobs) - len(kept)
+            self._jobs = deque(kept)
+        if dropped:
+            self._changed()
+        return dropped
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                self.current = self._jobs.popleft()
+            self._changed()
+            try:
+                self.current.run()
+            except Exception as e:
+                logger.error(f"Lỗi khi chạy '{self.current.name}': {e}", exc_info=True)
+            finally:
+                self.current = None
+                self._changed()
 
 def setup_custom_window(window, title_text, is_resizable=False, width=None, height=None):
     window.configure(fg_color=DARK_BG)
@@ -1646,6 +3782,7 @@ class ScriptSelector(ctk.CTkToplevel):
             messagebox.showwarning("Lỗi", "Tên không được để trống!", parent=self)
             return
 
+        script_manager.invalidate_compiled(self.category, self.scripts_list[index]['name'])
         self.scripts_list[index]['name'] = new_name
         script_manager.save_scripts()
         self.editing_index = -1
@@ -1662,6 +3799,7 @@ class ScriptSelector(ctk.CTkToplevel):
 
     def delete_script(self, index):
         if messagebox.askyesno("Xác nhận", "Xóa kịch bản này?", parent=self):
+            script_manager.invalidate_compiled(self.category, script_manager.scripts[self.category][index]['name'])
             del script_manager.scripts[self.category][index]
             if not any(s.get('active') for s in script_manager.scripts[self.category]) and script_manager.scripts[self.category]:
                 script_manager.scripts[self.category][0]['active'] = True
@@ -1672,6 +3810,40 @@ class ScriptSelector(ctk.CTkToplevel):
                 self.editing_index -= 1
             self.refresh_list()
 
+class RunReportWindow(ctk.CTkToplevel):
+    def __init__(self, master, report):
+        super().__init__(master)
+
+        self.content_frame, _ = setup_custom_window(self, f"Thời gian chạy: {report['script']}", is_resizable=True, width=620, height=420)
+
+        self.report = report
+        self.create_interface()
+
+    def create_interface(self):
+        report = self.report
+        totals = report['totals']
+        ctk.CTkLabel(self.content_frame, text=f"{report['started']} · Tổng {report['wall']:.2f}s · chụp {totals['capture']:.2f}s · khớp {totals['match']:.2f}s · chờ {totals['sleep']:.2f}s · lặp {totals['retries']}",
+                     font=(MAIN_FONT, 12, "bold")).pack(anchor="w", padx=10, pady=(10, 5))
+
+        text = tk.Text(self.content_frame, bg=FRAME_BG, fg="white", font=("Consolas", 10), borderwidth=0, wrap="none")
+        text.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        text.tag_configure('header', foreground=ACCENT_COLOR)
+        text.tag_configure('call', foreground="gray")
+
+        row = "{:<34}{:>8}{:>8}{:>8}{:>8}{:>6}\n"
+        text.insert(tk.END, row.format("Step", "Tổng", "Chụp", "Khớp", "Chờ", "Lặp"), 'header')
+        for step in report['steps']:
+            text.insert(tk.END, row.format(step['name'][:33], f"{step['wall']:.2f}", f"{step['capture']:.2f}", f"{step['match']:.2f}", f"{step['sleep']:.2f}", step['retries']))
+            for call in step['calls']:
+                name = f"  {call['method']}({call['key']})" if call['key'] else f"  {call['method']}"
+                text.insert(tk.END, row.format(name[:33], f"{call['wall']:.2f}", f"{call['capture']:.2f}", f"{call['match']:.2f}", f"{call['sleep']:.2f}", call['retries']), 'call')
+
+        if report['keys']:
+            text.insert(tk.END, "\nẢnh tốn thời gian nhất:\n", 'header')
+            for key, seconds in list(report['keys'].items())[:5]:
+                text.insert(tk.END, f"  {key}: {seconds:.2f}s\n")
+        text.configure(state="disabled")
+
 class FindReplaceDialog(ctk.CTkToplevel):
     def __init__(self, master, text_widget):
         super().__init__(master)
@@ -1832,6 +4004,7 @@ class ScriptEditor(ctk.CTkToplevel):
         self.create_tool_btn(self.toolbar, "", command=self.delete_block, image=icons.delete)
         self.create_tool_btn(self.toolbar, "", command=lambda: self.move_block(-1), image=icons.up)
         self.create_tool_btn(self.toolbar, "", command=lambda: self.move_block(1), image=icons.down)
+        self.create_tool_btn(self.toolbar, "1×", command=self.toggle_block_once)
 
         self.canvas = tk.Canvas(self.left_frame, bg="#282828", highlightthickness=0)
         self.scrollbar = ctk.CTkScrollbar(self.left_frame, orientation="vertical", command=self.canvas.yview)
@@ -1923,7 +4096,8 @@ class ScriptEditor(ctk.CTkToplevel):
                 fg_color = "black" if i == self.current_step_index else "white"
                 font_style = (MAIN_FONT, 10, "bold") if i == self.current_step_index else (MAIN_FONT, 10, "bold")
                 
-                lbl = ctk.CTkLabel(f, text=f"{i+1}. {step['name']}", text_color=fg_color, font=font_style, anchor="w")
+                once_mark = "  (1×)" if step.get('once', False) else ""
+                lbl = ctk.CTkLabel(f, text=f"{i+1}. {step['name']}{once_mark}", text_color=fg_color, font=font_style, anchor="w")
                 lbl.pack(fill="both", expand=True, padx=10, pady=5)
                 
                 lbl.bind("<Button-1>", lambda e, idx=i: self.select_block(idx))
@@ -1943,6 +4117,16 @@ class ScriptEditor(ctk.CTkToplevel):
         self.select_block(new_index)
         self.start_block_rename(new_index)
 
+    def toggle_block_once(self):
+        if self.current_step_index < 0:
+            return
+        step = self.steps[self.current_step_index]
+        if step.get('once', False):
+            step.pop('once')
+        else:
+            step['once'] = True
+        self.refresh_blocks()
+
     def rename_current_block(self):
         if self.current_step_index >= 0:
             self.start_block_rename(self.current_step_index)
@@ -2130,17 +4314,196 @@ class ScriptEditor(ctk.CTkToplevel):
     def save_all(self):
         if self.current_step_index >= 0:
             self.steps[self.current_step_index]['code'] = self.code_text.get("1.0", "end-1c")
+        errors = script_manager.validate_steps(self.category, self.script_data['name'], self.steps)
+        if errors:
+            self.select_block(errors[0][0])
+            messagebox.showerror("Lỗi cú pháp", "Không thể lưu, kiểm tra lại:\n" + "\n".join(msg for _, msg in errors), parent=self)
+            return
+        old_name = script_manager.scripts[self.category][self.script_index]['name']
         script_manager.scripts[self.category][self.script_index] = self.script_data
         script_manager.save_scripts()
+        script_manager.invalidate_compiled(self.category, old_name)
         if self.on_save_callback: self.on_save_callback()
 
+class Animation:
+    def __init__(self, widget, callback):
+        self.widget = widget
+        self.callback = callback
+        self.due = 0.0
+
+class AnimationScheduler:
+    def __init__(self, root, frame_budget=0.008, idle_interval=250):
+        self.root = root
+        self.frame_budget = frame_budget
+        self.idle_interval = idle_interval
+        self.animations = []
+        self._job = None
+
+    def register(self, widget, callback):
+        animation = Animation(widget, callback)
+        self.animations.append(animation)
+        self._reschedule(0)
+        return animation
+
+    def unregister(self, animation):
+        if animation in self.animations:
+            self.animations.remove(animation)
+
+    def _reschedule(self, delay):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+        self._job = self.root.after(max(1, int(delay)), self._tick)
+
+    def _tick(self):
+        self._job = None
+        started = time.perf_counter()
+        next_due = started + self.idle_interval / 1000
+        for animation in list(self.animations):
+            try:
+                if not animation.widget.winfo_exists():
+                    self.unregister(animation)
+                    continue
+                if not animation.widget.winfo_viewable():
+                    continue
+            except tk.TclError:
+                self.unregister(animation)
+                continue
+            if animation.due <= started:
+                if time.perf_counter() - started > self.frame_budget:
+                    next_due = started
+                    continue
+                try:
+                    delay = animation.callback()
+                except Exception as e:
+                    logger.error(f"Lỗi hiệu ứng: {e}")
+                    delay = None
+                if delay is None:
+                    self.unregister(animation)
+                    continue
+                animation.due = time.perf_counter() + delay / 1000
+                self.animations.remove(animation)
+                self.animations.append(animation)
+            next_due = min(next_due, animation.due)
+        self._reschedule((next_due - time.perf_counter()) * 1000)
+
+class VideoClip:
+    def __init__(self, frames, step, size, scaling=1.0):
+        self.frames = frames
+        self.step = step
+        self.size = size
+        self.images = [None] * len(frames)
+        self.frame_bytes = clip_frame_bytes(size, scaling)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def nbytes(self):
+        return len(self.frames) * self.frame_bytes
+
+    @property
+    def has_images(self):
+        return any(image is not None for image in self.images)
+
+    def image(self, index):
+        image = self.images[index]
+        if image is None:
+            frame = self.frames[index]
+            image = self.images[index] = ctk.CTkImage(light_image=frame, dark_image=frame, size=self.size)
+        return image
+
+def clip_frame_bytes(size, scaling=1.0):
+    width, height = size
+    return width * height * 4 + int(width * scaling) * int(height * scaling) * 4
+
+class VideoFrameCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._clips = OrderedDict()
+        self._bytes = 0
+        self._loading = set()
+        self._lock = threading.Lock()
+
+    def get(self, path, size, scaling=1.0):
+        key = (path, tuple(size), scaling)
+        with self._lock:
+            clip = self._clips.get(key)
+            if clip is not None:
+                self._clips.move_to_end(key)
+                self._evict(release_images=True)
+                return clip
+            if key in self._loading:
+                return None
+            self._loading.add(key)
+        threading.Thread(target=self._load, args=(key,), daemon=True).start()
+        return None
+
+    def preload(self, paths, size, scaling=1.0):
+        for path in paths:
+            key = (path, tuple(size), scaling)
+            with self._lock:
+                if key in self._clips or key in self._loading or not os.path.exists(path):
+                    continue
+                self._loading.add(key)
+            self._load(key)
+
+    def _evict(self, release_images):
+        for key in list(self._clips)[:-1]:
+            if self._bytes <= self.max_bytes:
+                break
+            clip = self._clips[key]
+            if clip.has_images and not release_images:
+                continue
+            del self._clips[key]
+            self._bytes -= clip.nbytes
+
+    def _load(self, key):
+        path, (width, height), scaling = key
+        frame_bytes = clip_frame_bytes((width, height), scaling)
+        frames = []
+        step = 1
+        start_time = time.time()
+        try:
+            cap = cv2.VideoCapture(path)
+            try:
+                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                step = max(1, -(-frame_count * frame_bytes // self.max_bytes))
+                index = 0
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    if index % step == 0:
+                        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR)
+                        frames.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                    index += 1
+            finally:
+                cap.release()
+        except Exception as e:
+            logger.error(f"Lỗi giải mã video {path}: {e}")
+        logger.info(f"Đã giải mã {len(frames)} khung hình của {os.path.basename(path)} trong {time.time() - start_time:.2f}s")
+
+        clip = VideoClip(frames, step, (width, height), scaling)
+        with self._lock:
+            self._loading.discard(key)
+            self._clips[key] = clip
+            self._bytes += clip.nbytes
+            self._evict(release_images=False)
+
+video_frames = VideoFrameCache(config_manager.settings.video_cache_mb * 1024 * 1024)
+
 class VideoPlayer:
-    def __init__(self, parent, image_folder, width=199, height=150):
+    def __init__(self, parent, image_folder, scheduler, width=199, height=150):
         self.parent = parent
         self.image_folder = image_folder
+        self.scheduler = scheduler
+        self.animation = None
         self.width = width
         self.height = height
-        self.cap = None
+        self.video_path = None
+        self.frames = None
+        self.frame_step = 1
+        self.frame_index = 0
         self.is_playing = False
         
         self.idle_files = ["Idle_1.mp4", "Idle_2.mp4", "Idle_3.mp4", "Idle_4.mp4"]
@@ -2150,6 +4513,10 @@ class VideoPlayer:
         
         self.label = ctk.CTkLabel(parent, text="")
         self.label.pack_forget()
+        self.scaling = ctk.ScalingTracker.get_widget_scaling(self.label)
+
+    def preload(self, video_paths):
+        video_frames.preload(video_paths, (self.width, self.height), self.scaling)
 
     def start_active(self, video_path):
         self.current_mode = "active"
@@ -2176,65 +4543,85 @@ class VideoPlayer:
             logger.error(f"Lỗi chọn video idle: {e}")
 
     def _load_video(self, path):
-        if self.cap:
-            self.cap.release()
-        
         if not os.path.exists(path):
             return
 
-        self.cap = cv2.VideoCapture(path)
+        self.video_path = path
+        self.frames = None
+        self.frame_index = 0
         self.is_playing = True
         self.label.pack(pady=10, side="bottom")
         
-        if not hasattr(self, 'update_job') or self.update_job is None:
-            self.update_frame()
+        if self.animation is None:
+            self.animation = self.scheduler.register(self.label, self.update_frame)
 
     def stop(self):
         self.is_playing = False
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        self.video_path = None
+        self.frames = None
         self.label.pack_forget()
         self.label.configure(image=None)
-        self.update_job = None
+        if self.animation:
+            self.scheduler.unregister(self.animation)
+            self.animation = None
 
     def update_frame(self):
-        if not self.is_playing or not self.cap:
-            self.update_job = None
-            return
+        if not self.is_playing or not self.video_path:
+            self.animation = None
+            return None
 
-        if not self.label.winfo_viewable():
-            self.update_job = self.label.after(500, self.update_frame)
-            return
+        if self.frames is None:
+            clip = video_frames.get(self.video_path, (self.width, self.height), self.scaling)
+            if clip is None:
+                return 100
+            self.frames, self.frame_step = clip, clip.step
+            self.frame_index = 0
 
-        ret, frame = self.cap.read()
-        
-        if not ret:
-            if self.current_mode == "active":
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret, frame = self.cap.read()
+        if self.frame_index >= len(self.frames):
+            if self.current_mode == "active" and self.frames:
+                self.frame_index = 0
             else:
                 self._play_random_idle()
-                if self.cap:
-                    ret, frame = self.cap.read()
-
-        if ret:
-            try:
-                frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
-                
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame)
-                ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=(self.width, self.height))
-                
-                self.label.configure(image=ctk_img)
-                self.label.image = ctk_img
-            except Exception:
-                pass
-
-            self.update_job = self.label.after(25, self.update_frame)
-        else:
-            self.update_job = self.label.after(100, self.update_frame)
+                return 100
+
+        ctk_img = self.frames.image(self.frame_index)
+        self.frame_index += 1
+        self.label.configure(image=ctk_img)
+        self.label.image = ctk_img
+        return 25 * self.frame_step
+
+def run_headless(argv):
+    parser = argparse.ArgumentParser(description="Chạy kịch bản không cần giao diện (mặc định trên màn hình mô phỏng).")
+    parser.add_argument('--run', metavar='CATEGORY', required=True, help="Nhóm kịch bản, ví dụ uid_col1")
+    parser.add_argument('--script', help="Tên kịch bản (mặc định: kịch bản đang Active)")
+    parser.add_argument('--backend', choices=['pyautogui', 'simulator'], default='simulator')
+    parser.add_argument('--scenario', help="File kịch bản mô phỏng")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="Biến ngữ cảnh cho kịch bản")
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    acs_auto.set_backend(create_backend(args.backend, acs_auto.templates, args.scenario))
+    script = script_manager.get_script(args.run, args.script)
+    if not script:
+        print(f"Không tìm thấy kịch bản cho '{args.run}'.")
+        return 1
+    extra_context = dict(item.split('=', 1) for item in args.set)
+
+    failed = 0
+    started = time.perf_counter()
+    for i in range(args.repeat):
+        if isinstance(acs_auto.backend, SimulatorBackend):
+            acs_auto.backend.reset()
+        results, report = run_script(script['steps'], extra_context, args.run, script['name'])
+        if run_failed(results):
+            failed += 1
+        print(f"[{i + 1}/{args.repeat}] {report['wall']:.3f}s · khớp {report['totals']['match']:.3f}s · chụp {report['totals']['capture']:.3f}s · {' | '.join(str(r) for r in results)}")
+    elapsed = time.perf_counter() - started
+    print(f"{args.repeat} lượt trong {elapsed:.2f}s ({args.repeat / elapsed:.2f} lượt/giây), {failed} lượt thất bại.")
+    return 1 if failed else 0
 
 if __name__ == "__main__":
+    if '--run' in sys.argv[1:]:
+        sys.exit(run_headless(sys.argv[1:]))
     app = AutoACSTool()
     app.mainloop()
@@ -0,0 +1,266 @@
+import sys
+import os
+import json
+import time
+import copy
+import argparse
+import contextlib
+import numpy as np
+import cv2
+import main
+
+class ReplayBackend:
+    realtime = False
+
+    def __init__(self, player, realtime=False):
+        self.player = player
+        self.clock = None if realtime else main.VirtualClock()
+        self.inputs = []
+        self.windows = {title: main.SimWindow(self, title, region) for title, region in player.session['windows'].items()}
+
+    def time(self):
+        return self.clock.time() if self.clock else time.time()
+
+    def sleep(self, seconds):
+        if self.clock:
+            self.clock.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def screenshot(self, region=None):
+        return self.player.screenshot(region)
+
+    def screen_size(self):
+        return tuple(self.player.session['screen'])
+
+    def list_windows(self, title):
+        windows = [window for window_title, window in self.windows.items() if title in window_title]
+        if windows:
+            return windows
+        screen_width, screen_height = self.screen_size()
+        return [main.SimWindow(self, title, (0, 0, screen_width, screen_height))]
+
+    def launch(self, path, title):
+        self.inputs.append(('launch', path))
+        region = self.player.session['windows'].get(title)
+        if region and title not in self.windows:
+            self.windows[title] = main.SimWindow(self, title, region)
+
+    def click(self, x, y, button='left'):
+        self.inputs.append(('click', x, y))
+
+    def double_click(self, x, y):
+        self.inputs.append(('double_click', x, y))
+
+    def drag(self, x, y, x_offset, y_offset, duration=1):
+        self.inputs.append(('drag', x, y, x_offset, y_offset))
+
+    def type_text(self, text, interval=0.05):
+        self.inputs.append(('type_text', text))
+
+    def hotkey(self, *keys):
+        self.inputs.append(('hotkey',) + keys)
+
+    def press(self, key):
+        self.inputs.append(('press', key))
+
+class SessionPlayer:
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        with open(os.path.join(session_dir, 'session.json'), 'r', encoding='utf-8') as f:
+            self.session = json.load(f)
+        self.cursor = 0
+        self.frames = []
+        self.frame_index = 0
+        self.last_frame = None
+        self.replayed = []
+        self._entry = None
+        self._depth = 0
+        self._canvases = {}
+
+    def start_run(self, category, script_name, steps, extra_context):
+        pass
+
+    def finish_run(self, results, report=None):
+        return None
+
+    def record_window(self, title, region):
+        pass
+
+    def frame(self, frame, region):
+        pass
+
+    def _next_recorded_call(self, method, image_name_key):
+        for i in range(self.cursor, len(self.session['calls'])):
+            recorded = self.session['calls'][i]
+            if recorded['method'] == method and recorded['key'] == image_name_key:
+                self.cursor = i + 1
+                return recorded
+        return None
+
+    @contextlib.contextmanager
+    def call(self, method, image_name_key=None):
+        self._depth += 1
+        if self._depth > 1:
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+            return
+        recorded = self._next_recorded_call(method, image_name_key)
+        self.frames = recorded['frames'] if recorded else []
+        self.frame_index = 0
+        self._entry = {'method': method, 'key': image_name_key, 'recorded': recorded is not None,
+                       'live': recorded['result'] if recorded else None, 'result': None}
+        try:
+            yield self
+        finally:
+            self.replayed.append(self._entry)
+            self._entry = None
+            self._depth -= 1
+
+    def set_result(self, result):
+        if self._entry is not None and self._depth == 1:
+            self._entry['result'] = main.to_jsonable(result)
+
+    def _canvas(self, entry):
+        key = (entry['file'], tuple(entry['region'] or ()))
+        canvas = self._canvases.get(key)
+        if canvas is None:
+            screen_width, screen_height = self.session['screen']
+            canvas = np.zeros((screen_height, screen_width, 3), dtype=np.uint8)
+            frame = cv2.imdecode(np.fromfile(os.path.join(self.session_dir, 'frames', entry['file']), dtype=np.uint8), cv2.IMREAD_COLOR)
+            left, top = entry['region'][:2] if entry['region'] else (0, 0)
+            height = min(frame.shape[0], screen_height - top)
+            width = min(frame.shape[1], screen_width - left)
+            canvas[top:top + height, left:left + width] = frame[:height, :width]
+            canvas = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB)
+            self._canvases[key] = canvas
+        return canvas
+
+    def screenshot(self, region=None):
+        if self.frames:
+            self.last_frame = self.frames[min(self.frame_index, len(self.frames) - 1)]
+            self.frame_index += 1
+        if self.last_frame is None:
+            screen_width, screen_height = self.session['screen']
+            canvas = np.zeros((screen_height, screen_width, 3), dtype=np.uint8)
+        else:
+            canvas = self._canvas(self.last_frame)
+        if region:
+            left, top, width, height = region
+            canvas = canvas[top:top + height, left:left + width]
+        return canvas
+
+def comparable(value):
+    if isinstance(value, dict):
+        return {k: comparable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [comparable(v) for v in value if not isinstance(v, float)]
+    if isinstance(value, float):
+        return None
+    return value
+
+def find_sessions(paths):
+    sessions = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, 'session.json')):
+            sessions.append(path)
+        elif os.path.isdir(path):
+            sessions.extend(os.path.join(path, d) for d in sorted(os.listdir(path))
+                            if os.path.exists(os.path.join(path, d, 'session.json')))
+    return sessions
+
+def replay_session(session_dir, realtime=False):
+    player = SessionPlayer(session_dir)
+    session = player.session
+    backend = ReplayBackend(player, realtime)
+
+    acs_auto = main.acs_auto
+    acs_auto.set_backend(backend)
+    acs_auto.recorder = player
+    acs_auto.stop_requested = False
+    acs_auto.search_window_title = None
+    acs_auto.match_history.data = copy.deepcopy(session.get('match_history', {}))
+    acs_auto.match_history.filepath = os.path.join(session_dir, 'replay_history.json')
+    acs_auto.profiler.filepath = os.path.join(session_dir, 'replay_profile.jsonl')
+    acs_auto.excel_data = [{}] * session['excel_rows'] if session['excel_rows'] else None
+    acs_auto.current_excel_row_index = session['excel_row_index']
+
+    steps = session['steps']
+    for script in main.script_manager.get_scripts_by_category(session['category']):
+        if script['name'] == session['script']:
+            steps = script['steps']
+            break
+
+    results, report = main.run_script(steps, session['context'], session['category'], session['script'])
+
+    mismatches = [entry for entry in player.replayed if not entry['recorded'] or comparable(entry['live']) != comparable(entry['result'])]
+    return {
+        'session': os.path.basename(session_dir),
+        'script': session['script'],
+        'live': session.get('profile'),
+        'replay': report,
+        'calls': player.replayed,
+        'mismatches': mismatches,
+        'unreplayed': len(session['calls']) - player.cursor,
+        'results_match': [str(r) for r in results] == session['results'],
+        'inputs': len(backend.inputs),
+    }
+
+def key_latencies(report):
+    latencies = {}
+    for step in (report or {}).get('steps', []):
+        for call in step['calls']:
+            if call['key']:
+                stat = latencies.setdefault(call['key'], {'calls': 0, 'wall': 0.0, 'match': 0.0})
+                stat['calls'] += 1
+                stat['wall'] += call['wall']
+                stat['match'] += call['match']
+    return latencies
+
+def print_summary(summary):
+    live, replay = summary['live'], summary['replay']
+    print(f"\n=== {summary['session']} · {summary['script']}")
+    print(f"Tổng thời gian: live {live['wall'] if live else 0:.2f}s · replay {replay['wall']:.2f}s (khớp {replay['totals']['match']:.2f}s, chụp {replay['totals']['capture']:.2f}s)")
+    live_keys = key_latencies(live)
+    row = "{:<32}{:>6}{:>12}{:>12}{:>12}"
+    print(row.format("Key", "Lần", "Live ms", "Replay ms", "Khớp ms"))
+    for key, stat in sorted(key_latencies(replay).items(), key=lambda kv: -kv[1]['wall']):
+        live_stat = live_keys.get(key)
+        live_ms = f"{live_stat['wall'] / live_stat['calls'] * 1000:.1f}" if live_stat else "-"
+        print(row.format(key[:31], stat['calls'], live_ms, f"{stat['wall'] / stat['calls'] * 1000:.1f}", f"{stat['match'] / stat['calls'] * 1000:.1f}"))
+    for entry in summary['mismatches']:
+        print(f"  ≠ {entry['method']}({entry['key']}): live={entry['live']} replay={entry['result']}")
+    if summary['unreplayed']:
+        print(f"  ≠ {summary['unreplayed']} lệnh đã ghi không được gọi lại")
+    print(f"Kết quả giống live: {'có' if summary['results_match'] and not summary['mismatches'] and not summary['unreplayed'] else 'không'}")
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy lại các phiên đã ghi để đo hiệu năng khớp ảnh.")
+    parser.add_argument('paths', nargs='*', default=['recordings'], help="Thư mục phiên (chứa session.json) hoặc thư mục chứa nhiều phiên")
+    parser.add_argument('--realtime', action='store_true', help="Giữ nguyên các lệnh chờ (time.sleep, action_delay)")
+    parser.add_argument('--json', help="Ghi kết quả chi tiết ra file JSON")
+    args = parser.parse_args(argv)
+
+    sessions = find_sessions(args.paths)
+    if not sessions:
+        print("Không tìm thấy phiên nào để chạy lại.")
+        return 1
+
+    summaries = []
+    for session_dir in sessions:
+        summary = replay_session(session_dir, args.realtime)
+        print_summary(summary)
+        summaries.append(summary)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, indent=4, ensure_ascii=False)
+
+    failed = [s for s in summaries if s['mismatches'] or s['unreplayed'] or not s['results_match']]
+    print(f"\n{len(summaries) - len(failed)}/{len(summaries)} phiên khớp với lần chạy live.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run())